@@ -1,10 +1,15 @@
 import time
 
 from mesa import Agent
+from proxemics import ZONES
 import random
 import math
 
 
+# pause after every agent step so the pygame window can follow the run, headless runs don't wait
+STEP_DELAYS = {"Walking": 0.05, "Headless": 0.0}
+
+
 class CrowdAgent(Agent):
     def __init__(self, unique_id, model, scenario, obstacles):
         super().__init__(unique_id, model)
@@ -13,23 +18,49 @@ class CrowdAgent(Agent):
         self.collision_attempts = 0
         self.velocity = 0.02
         self.destination = Destination((0, 0), 'no', (0, 0, 0))
-        self.personal_space_radius = 2
+        self.personal_space_radius = model.params.get("personal_space_radius", ZONES["personal"])
         self.visited_positions = []
-        self.memory_limit = 4
+        self.memory_limit = int(model.params.get("memory_limit", 4))
+        self.waiting_steps = 0
+        # last step accounted for while asleep in the active set scheduler, None when awake
+        self.caught_up_to = None
+        self.sleep_records_stay = False
+        # cell this agent ran into during its last turn, and the one it keeps running into while asleep
+        self.last_collision = None
+        self.sleep_collision = None
         self.has_moved = False
         self.reached_destination = False
+        self.exit_group = None
+        self.next_route_step = 0
         self.scenario = scenario
 
     def is_finished(self, x, y):
+        router = self.model.router
+        if router is not None and (x, y) in router.destination_at:
+            # routed agents leave through whichever exit they reach, also one they start on
+            self.destination = router.destination_at[(x, y)]
+
         if abs(x - self.destination.pos[0]) + abs(y - self.destination.pos[1]) < 1:
             self.reached_destination = True
             if self.destination.preset == 'exit':
+                self.model.exits_in_step += 1
+                self.model.measurements.record_leave(self.pos)
+                if router is not None:
+                    router.leave(self)
                 self.model.schedule.remove(self)
                 self.model.grid.remove_agent(self)
             return True
         return False
 
     def step(self):
+        if self.caught_up_to is not None:
+            self.catch_up(self.model.schedule.steps - 1)
+            self.caught_up_to = None
+            if self.sleep_collision is not None:
+                self.model.standing_collisions[self.sleep_collision] -= 1
+                self.sleep_collision = None
+        self.last_collision = None
+
         if not self.is_finished(self.pos[0], self.pos[1]):
             if not self.move_towards_goal_or_avoid_intruder(self.destination.pos):
                 # Try escaping if movement towards the goal was blocked
@@ -40,7 +71,40 @@ class CrowdAgent(Agent):
 
         self.steps += 1
 
-        time.sleep(0.05) if self.scenario == "Walking" else time.sleep(0.015)
+        delay = STEP_DELAYS.get(self.scenario, 0.015)
+        if delay:
+            time.sleep(delay)
+
+    def neighbour_cells(self):
+        x, y = self.pos
+        return [(x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)]
+
+    def fall_asleep(self, records_stay, until=None):
+        self.caught_up_to = self.model.schedule.steps
+        self.sleep_records_stay = records_stay
+        # the blocking neighbour cannot change without a neighbouring cell being vacated, which wakes the agent
+        self.sleep_collision = self.last_collision
+        if self.sleep_collision is not None:
+            self.model.pending_collisions.append(self.sleep_collision)
+        self.model.schedule.sleep(self, self.neighbour_cells(), until)
+
+    def catch_up(self, until_step):
+        # replay the bookkeeping of the steps skipped while asleep, as if the agent had stayed in place
+        skipped = until_step - self.caught_up_to
+        if skipped <= 0:
+            return
+        self.caught_up_to = until_step
+        self.steps += skipped
+        if self.sleep_collision is not None:
+            self.collision_attempts += skipped
+        if not self.sleep_records_stay:
+            return
+
+        edge = (self.pos, self.pos)
+        self.model.path_counts[edge] = self.model.path_counts.get(edge, 0) + skipped
+        self.model.visited_counts[self.pos] = self.model.visited_counts.get(self.pos, 0) + skipped
+        self.visited_positions.extend([self.pos] * min(skipped, self.memory_limit))
+        del self.visited_positions[:-self.memory_limit]
 
     @staticmethod
     def calculate_distance(pos1, pos2):
@@ -56,26 +120,61 @@ class CrowdAgent(Agent):
 
         # if not intruders:
 
+        if self.model.movement_mode == "social_distance":
+            return self.move_keeping_social_distance(goal_pos)
+
         return self.move_towards_goal(goal_pos)
 
         # return self.avoid_intruders(intruders, goal_pos)
 
     def move_towards_goal(self, goal_pos):
-        new_pos = self.get_next_position(self.pos[0], self.pos[1])
-
-        # if not self.is_position_valid(new_pos):
-        #     self.collision_attempts += 1
-        #     if new_pos in self.model.collision_count:
-        #         self.model.collision_count[new_pos] += 1
-        #     else:
-        #         self.model.collision_count[new_pos] = 1
-        #     return False
+        if self.model.router is not None:
+            new_pos = self.get_routed_position()
+        else:
+            new_pos = self.get_next_position(self.pos[0], self.pos[1])
 
         if not self.try_reserve_position(new_pos):
             return True
         self.update_visited_positions(new_pos)
+        if new_pos == self.pos:
+            if self.model.router is None:
+                # no free cell around, nothing changes until a neighbouring cell is vacated
+                self.fall_asleep(records_stay=True)
+            elif not any(self.is_position_valid(pos) for pos in self.neighbour_cells()):
+                # boxed in, but the exit is still chosen again every route_interval steps
+                self.fall_asleep(records_stay=True, until=self.next_route_step)
+        self.model.grid.move_agent(self, new_pos)
+        return True
+
+    def move_keeping_social_distance(self, goal_pos):
+        self.record_collision(min(self.neighbour_cells(), key=lambda pos: self.calculate_distance(pos, goal_pos)))
+        moves = [pos for pos in self.neighbour_cells() if self.is_position_valid(pos)]
+        if not moves:
+            self.fall_asleep(records_stay=False)
+            return False
+
+        # staying in place is a candidate too, moving only pays off if it lowers the cost
+        candidates = [self.pos] + moves
+        index = self.model.proxemic_index
+        intrusion = index.intrusion_cost(candidates, index.neighbours(self.pos))
+
+        costs = []
+        for pos, cost in zip(candidates, intrusion):
+            cost += self.model.goal_weight * self.calculate_distance(pos, goal_pos)
+            if pos == self.pos:
+                # growing impatience breaks standoffs in front of narrow passages
+                cost += self.model.goal_weight * self.waiting_steps
+            elif pos in self.visited_positions:
+                cost += self.model.goal_weight
+            costs.append(cost)
+
+        new_pos = candidates[costs.index(min(costs))]
+        if new_pos == self.pos or not self.try_reserve_position(new_pos):
+            self.waiting_steps += 1
+            return True
+        self.waiting_steps = 0
+        self.update_visited_positions(new_pos)
         self.model.grid.move_agent(self, new_pos)
-        # self.update_visited_positions(new_pos)
         return True
 
     def avoid_intruders(self, intruders, goal_pos):
@@ -110,8 +209,8 @@ class CrowdAgent(Agent):
             best_direction = min(forces, key=forces.get)
             best_pos = directions[best_direction]
             if self.is_position_valid(best_pos):
-                self.model.grid.move_agent(self, best_pos)
                 self.update_visited_positions(best_pos)
+                self.model.grid.move_agent(self, best_pos)
                 return True
         return False
 
@@ -136,14 +235,28 @@ class CrowdAgent(Agent):
 
         for new_pos, _ in valid_positions:
             if new_pos not in self.visited_positions:
-                self.model.grid.move_agent(self, new_pos)
                 self.update_visited_positions(new_pos)
+                self.model.grid.move_agent(self, new_pos)
                 return
 
 
+    def get_routed_position(self):
+        router = self.model.router
+        if self.exit_group is None or self.model.schedule.steps >= self.next_route_step:
+            self.exit_group = router.choose_exit(self.pos)
+            self.next_route_step = self.model.schedule.steps + router.route_interval
+        if self.exit_group is None:
+            # no exit reachable from here, fall back to the hourglass rule
+            return self.get_next_position(self.pos[0], self.pos[1])
+
+        router.update_queue(self, self.exit_group, self.pos)
+        self.record_collision(router.preferred_position(self.exit_group, self.pos))
+        return router.next_position(self.exit_group, self.pos, self.is_position_valid)
+
 # Przepraszam za te warunki...
 #TODO: Make it more readable...
     def get_next_position(self, dx, dy):
+        self.record_collision(((dx + 1, dy) if dx < 15 else (dx - 1, dy)) if dy == 29 else (dx, dy + 1))
         if dy == 29:
             if dx < 15:
                 if self.is_position_valid((dx + 1, dy)):
@@ -169,9 +282,13 @@ class CrowdAgent(Agent):
         return (0 <= pos[0] < self.model.grid.width and
                 0 <= pos[1] < self.model.grid.height and
                 self.model.grid.is_cell_empty(pos) and
-                pos not in [o.pos for o in self.obstacles])
+                pos not in self.model.obstacle_positions)
 
     def update_visited_positions(self, new_pos):
+        # called before the grid move, so self.pos is still the previous cell
+        if new_pos != self.pos:
+            self.model.moves_in_step += 1
+            self.model.measurements.record_move(self.pos, new_pos)
         if self.visited_positions:
             last_pos = self.visited_positions[-1]
             edge = (last_pos, new_pos)
@@ -189,8 +306,18 @@ class CrowdAgent(Agent):
         else:
             self.model.visited_counts[new_pos] = 1
 
+    def record_collision(self, pos):
+        # the cell the agent would rather move to is taken by another agent or already reserved this step
+        if pos == self.pos or not (0 <= pos[0] < self.model.grid.width and 0 <= pos[1] < self.model.grid.height):
+            return
+        if pos in self.model.next_positions or isinstance(self.model.grid[pos], CrowdAgent):
+            self.collision_attempts += 1
+            self.model.step_collisions[pos] += 1
+            self.last_collision = pos
+
     def try_reserve_position(self, pos):
         if pos in self.model.next_positions:
+            self.record_collision(pos)
             return False
 
         self.model.next_positions.add(pos)
@@ -0,0 +1,273 @@
+import argparse
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from crowd_model import CrowdModel
+
+BASE_FOLDER = os.path.dirname(os.path.abspath(__file__))
+CALIBRATION_CACHE_FOLDER = os.path.join(BASE_FOLDER, 'calibration_cache')
+CALIBRATION_RUNS_FOLDER = os.path.join(BASE_FOLDER, 'calibration_runs')
+# bumped whenever simulate() changes what it returns, so older cache entries are not reused
+CACHE_VERSION = 2
+
+
+def set_param(params, name, value):
+    # dotted names reach into nested preset entries, e.g. "zone_weights.intimate"
+    *parents, key = name.split(".")
+    for parent in parents:
+        params = params.setdefault(parent, {})
+    params[key] = value
+
+
+def build_params(preset_path, overrides):
+    with open(preset_path, 'r') as f:
+        params = json.load(f)
+    for name, value in overrides.items():
+        set_param(params, name, value)
+    return params
+
+
+def evaluation_key(params, seed, max_steps, targets):
+    payload = json.dumps({"params": params, "seed": seed, "max_steps": max_steps, "targets": targets,
+                          "version": CACHE_VERSION}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def calibration_loss(metrics, targets):
+    return sum(((metrics[name] - target) / target) ** 2 for name, target in targets.items())
+
+
+def simulate(preset_path, overrides, seed, targets, max_steps, cutoff=None):
+    params = build_params(preset_path, overrides)
+    model = CrowdModel(preset_path, "Headless", overrides=params, seed=seed)
+    target_time = targets.get("evacuation_time")
+
+    steps = 0
+    evacuated = False
+    stopped_early = False
+    while steps < max_steps:
+        model.step()
+        steps += 1
+        if all(not agent.has_moved for agent in model.schedule.agents):
+            evacuated = True
+            break
+        # evacuation takes at least `steps`, so past the target time this is a lower bound of the loss
+        if (cutoff is not None and target_time and steps > target_time
+                and ((steps - target_time) / target_time) ** 2 > cutoff):
+            stopped_early = True
+            break
+
+    measurements = model.measurements
+    measurements.finish()
+    line = measurements.line_names.index("neck") if "neck" in measurements.line_names else 0
+    metrics = {
+        "evacuation_time": steps,
+        "neck_flow": measurements.line_totals[line] / steps if measurements.line_totals else 0.0,
+        "evacuated": evacuated,
+    }
+    return {
+        "metrics": metrics,
+        "loss": calibration_loss(metrics, targets),
+        "stopped_early": stopped_early,
+    }
+
+
+def evaluate_task(task):
+    return simulate(task["preset"], task["overrides"], task["seed"], task["targets"], task["max_steps"],
+                    task["cutoff"])
+
+
+class EvaluationCache:
+    # Results keyed by a hash of the full preset, seed and targets, kept in memory and mirrored to one json file each.
+
+    def __init__(self, folder=CALIBRATION_CACHE_FOLDER):
+        self.folder = folder
+        self.results = {}
+        os.makedirs(folder, exist_ok=True)
+
+    def get(self, key, cutoff):
+        result = self.results.get(key)
+        if result is None:
+            path = os.path.join(self.folder, f"{key}.json")
+            if not os.path.exists(path):
+                return None
+            with open(path, 'r') as f:
+                result = json.load(f)
+            self.results[key] = result
+
+        # a run cut short only proves the candidate is worse than the cutoff it was stopped at
+        if result["stopped_early"] and (cutoff is None or result["loss"] < cutoff):
+            return None
+        return result
+
+    def put(self, key, result):
+        self.results[key] = result
+        with open(os.path.join(self.folder, f"{key}.json"), 'w') as f:
+            json.dump(result, f)
+
+
+class Calibration:
+    # Separable evolution strategy in the unit box of the calibrated parameters: every generation samples a
+    # population around the mean, then moves the mean and per-parameter spread towards the best half
+    # (CMA-ES style weighted recombination with a diagonal covariance).
+
+    def __init__(self, config, output_folder, workers=None, cache=None):
+        self.config = config
+        self.output_folder = output_folder
+        self.workers = workers
+        self.cache = cache or EvaluationCache()
+
+        self.names = list(config["parameters"])
+        self.lower = np.array([config["parameters"][name]["bounds"][0] for name in self.names], dtype=float)
+        self.upper = np.array([config["parameters"][name]["bounds"][1] for name in self.names], dtype=float)
+        self.population = config.get("population", 8)
+        self.elite = max(1, self.population // 2)
+        weights = np.log(self.elite + 0.5) - np.log(np.arange(1, self.elite + 1))
+        self.weights = weights / weights.sum()
+
+        self.state_path = os.path.join(output_folder, "state.json")
+        self.history_path = os.path.join(output_folder, "history.jsonl")
+        os.makedirs(output_folder, exist_ok=True)
+
+        if os.path.exists(self.state_path):
+            with open(self.state_path, 'r') as f:
+                state = json.load(f)
+            self.generation = state["generation"]
+            self.mean = np.array(state["mean"])
+            self.sigma = np.array(state["sigma"])
+            self.best = state["best"]
+            self.rng = np.random.default_rng()
+            self.rng.bit_generator.state = state["rng"]
+        else:
+            self.generation = 0
+            self.mean = np.full(len(self.names), 0.5)
+            self.sigma = np.full(len(self.names), config.get("initial_sigma", 0.3))
+            self.best = None
+            self.rng = np.random.default_rng(config.get("seed"))
+
+    def to_overrides(self, point):
+        # snapping to each parameter's step makes neighbouring candidates share cache entries
+        overrides = {}
+        values = self.lower + np.clip(point, 0.0, 1.0) * (self.upper - self.lower)
+        for name, value in zip(self.names, values):
+            spec = self.config["parameters"][name]
+            step = spec.get("step")
+            if step:
+                value = spec["bounds"][0] + round((value - spec["bounds"][0]) / step) * step
+            overrides[name] = int(round(value)) if spec.get("integer") else round(float(value), 10)
+        return overrides
+
+    def cutoff(self):
+        if self.best is None:
+            return None
+        return self.config.get("early_stop_factor", 4.0) * max(self.best["loss"], 1e-6)
+
+    def evaluate(self, candidates, pool):
+        preset = self.config["preset"]
+        max_steps = self.config.get("max_steps", 500)
+        cutoff = self.cutoff()
+
+        records, tasks = [], []
+        for index, overrides in enumerate(candidates):
+            params = build_params(preset, overrides)
+            for seed in self.config.get("seeds", [0]):
+                key = evaluation_key(params, seed, max_steps, self.config["targets"])
+                record = {"generation": self.generation, "candidate": index, "params": overrides,
+                          "seed": seed, "key": key}
+                cached = self.cache.get(key, cutoff)
+                if cached is not None:
+                    record.update(cached, cached_result=True)
+                else:
+                    record["cached_result"] = False
+                    tasks.append((record, {"preset": preset, "overrides": overrides, "seed": seed,
+                                           "targets": self.config["targets"], "max_steps": max_steps,
+                                           "cutoff": cutoff}))
+                records.append(record)
+
+        # the same key can show up twice in one generation, run it once
+        unique = {}
+        for record, task in tasks:
+            unique.setdefault(record["key"], task)
+        results = dict(zip(unique, pool.map(evaluate_task, unique.values())))
+        for key, result in results.items():
+            self.cache.put(key, result)
+        for record, _ in tasks:
+            record.update(results[record["key"]])
+
+        losses = np.zeros(len(candidates))
+        for record in records:
+            losses[record["candidate"]] += record["loss"]
+        return losses / len(self.config.get("seeds", [0])), records
+
+    def run_generation(self, pool):
+        points = np.clip(self.mean + self.sigma * self.rng.standard_normal((self.population, len(self.names))),
+                         0.0, 1.0)
+        candidates = [self.to_overrides(point) for point in points]
+        losses, records = self.evaluate(candidates, pool)
+
+        order = np.argsort(losses)
+        elite = points[order[:self.elite]]
+        old_mean = self.mean
+        self.mean = self.weights @ elite
+        spread = np.sqrt(self.weights @ (elite - old_mean) ** 2)
+        self.sigma = np.maximum(0.5 * self.sigma + 0.5 * spread, self.config.get("min_sigma", 0.02))
+
+        if self.best is None or losses[order[0]] < self.best["loss"]:
+            self.best = {"params": candidates[order[0]], "loss": float(losses[order[0]]),
+                         "generation": self.generation}
+
+        with open(self.history_path, 'a') as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+        self.generation += 1
+        self.save_state()
+
+    def save_state(self):
+        state = {
+            "generation": self.generation,
+            "mean": self.mean.tolist(),
+            "sigma": self.sigma.tolist(),
+            "best": self.best,
+            "rng": self.rng.bit_generator.state,
+        }
+        temp_path = f"{self.state_path}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(temp_path, self.state_path)
+
+    def run(self):
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            while self.generation < self.config.get("generations", 10):
+                self.run_generation(pool)
+                print(f"generation {self.generation}: best loss {self.best['loss']:.4f} {self.best['params']}")
+        return self.best
+
+
+def load_config(path):
+    with open(path, 'r') as f:
+        config = json.load(f)
+    # presets are looked up next to the calibration config
+    config["preset"] = os.path.join(os.path.dirname(os.path.abspath(path)), config["preset"])
+    return config
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibrate preset parameters against target metrics.")
+    parser.add_argument("config", help="calibration config json")
+    parser.add_argument("--output", help="folder for the search history, reused to resume a search")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    name = os.path.splitext(os.path.basename(args.config))[0]
+    output = args.output or os.path.join(CALIBRATION_RUNS_FOLDER, name)
+    best = Calibration(config, output, args.workers).run()
+    print(json.dumps(best, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,30 @@
 import mesa
 import json
+import os
+import time
+import uuid
+import numpy as np
 from agent import *
+from proxemics import ZONES, ProxemicIndex
+from measurements import FlowMeasurements
+from scheduler import ActiveSetActivation, CrowdGrid
+from routing import ExitRouter
 
 
 class CrowdModel(mesa.Model):
 
-    def __init__(self, config_file_path, scenario):
-        super().__init__()
+    def __init__(self, config_file_path, scenario, overrides=None, seed=None):
+        super().__init__(seed=seed)
 
         with open(config_file_path, 'r') as f:
             params = json.load(f)
+        params.update(overrides or {})
 
         self.agents_count_id = 0
         self.params = params
+        preset_name = os.path.splitext(os.path.basename(config_file_path))[0]
+        # unique per run, a run_id from the preset only names the runs, so cached statistics never go stale
+        self.run_id = f"{params.get('run_id', preset_name)}-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
         self.next_positions = set()
         self.num_agents = params.get("num_agents", 10)
         self.num_destinations = params.get("num_objectives", 3)
@@ -24,20 +36,55 @@ class CrowdModel(mesa.Model):
         self.obstacles = []
         self.destinations = []
         self.scenario = scenario
-
-        self.grid = mesa.space.SingleGrid(self.grid_width, self.grid_height, False)
-        self.schedule = mesa.time.SimultaneousActivation(self)
+        self.movement_mode = params.get("movement_mode", "cellular")
+        self.goal_weight = params.get("goal_weight", 1.0)
+        zones = dict(params.get("proxemic_zones") or ZONES)
+        # the personal zone is the agents' personal space, so calibrating the radius changes the social mode
+        if "personal_space_radius" in params:
+            zones["personal"] = params["personal_space_radius"]
+        self.proxemic_index = ProxemicIndex(zones, params.get("zone_weights"))
+
+        self.schedule = ActiveSetActivation(self)
+        self.grid = CrowdGrid(self.grid_width, self.grid_height, False, on_vacate=self.schedule.cell_vacated)
         self.agents = []
         self.visited_counts = {}
-        self.collision_count = {}
+        # agents running into a taken cell, per cell, accumulated in step_collisions and folded in once per step
+        self.collision_count = np.zeros((self.grid_width, self.grid_height), dtype=np.int64)
+        self.step_collisions = np.zeros_like(self.collision_count)
+        # cells that sleeping agents keep running into every step they skip, counted from the step after
+        # they fell asleep
+        self.standing_collisions = np.zeros_like(self.collision_count)
+        self.pending_collisions = []
         self.path_counts = {}
         self.collision_history = []
-        self.intruders_history = {"intimate": [], "personal": [], "social": []}
+        self.agents_in_step = 0
+        self.moves_in_step = 0
+        self.exits_in_step = 0
+        self.intruders_history = {zone: [] for zone in self.proxemic_index.zone_names}
 
         self.setup_obstacles()
+        # looked up by every move check, generated scenarios have thousands of wall cells
+        self.obstacle_positions = {obstacle.pos for obstacle in self.obstacles}
         self.generate_unique_destinations()
+
+        self.router = None
+        if self.movement_mode == "routing":
+            self.router = ExitRouter(self.grid_width, self.grid_height, self.destinations,
+                                     self.obstacle_positions,
+                                     params.get("route_interval", 10), params.get("congestion_weight", 1.0),
+                                     params.get("queue_radius", 3))
+
         self.generate_agents()
 
+        neck_area = params.get("neck_area", self.get_base_neck_area())
+        self.neck_cells = [(x, y) for x in range(*neck_area["width"]) for y in range(*neck_area["height"])
+                           if (x, y) not in self.obstacle_positions]
+
+        self.measurements = FlowMeasurements.from_params(params, self.grid_width, self.grid_height,
+                                                         neck_area, self.obstacle_positions)
+        for agent in self.schedule.agents:
+            self.measurements.record_enter(agent.pos)
+
     def load_obstacles(self, obstacle_data):
         obstacles = []
         for i, data in enumerate(obstacle_data):
@@ -49,6 +96,10 @@ class CrowdModel(mesa.Model):
     def get_base_grid_sizes(self):
         return {"width": [0, self.grid_width], "height": [0, self.grid_height]}
 
+    def get_base_neck_area(self):
+        mid_x, mid_y = self.grid_width // 2, self.grid_height // 2
+        return {"width": [mid_x - 2, mid_x + 2], "height": [mid_y - 2, mid_y + 2]}
+
     def load_destinations(self, destination_data):
         destinations = []
         for i, data in enumerate(destination_data):
@@ -60,12 +111,14 @@ class CrowdModel(mesa.Model):
         return destinations
 
     def generate_agents(self):
+        # generated scenarios list the start cell of every agent
+        positions = self.params.get("agent_positions")
         for i in range(self.num_agents):
             a = CrowdAgent(len(self.schedule.agents), self, self.scenario, self.obstacles)
             self.agents.append(a)
             self.schedule.add(a)
 
-            x, y = self.get_place_for_agent()
+            x, y = tuple(positions[i]) if positions else self.get_place_for_agent()
             self.grid.place_agent(a, (x, y))
             a.pos = x, y
         self.agents_count_id += self.num_agents
@@ -73,13 +126,13 @@ class CrowdModel(mesa.Model):
 
     def setup_obstacles(self):
         if self.randomize_obstacles:
-            num_obstacles = len(self.obstacles) or 10
-            for _ in range(num_obstacles):
-                x = self.random.randrange(self.grid.width)
-                y = self.random.randrange(self.grid.height)
-                if self.grid.is_cell_empty((x, y)):
-                    obstacle = Obstacle(len(self.agents), self, (x, y))
-                    self.obstacles.append(obstacle)
+            # distinct cells, so exactly num_obstacles are placed, never on an objective
+            objectives = {tuple(data["position"]) for data in self.params.get("objectives", [])}
+            cells = [(x, y) for x in range(self.grid.width) for y in range(self.grid.height)
+                     if (x, y) not in objectives]
+            num_obstacles = min(self.params.get("num_obstacles", 10), len(cells))
+            for i, pos in enumerate(self.random.sample(cells, num_obstacles)):
+                self.obstacles.append(Obstacle(i, self, pos))
         else:
             self.obstacles = self.load_obstacles(self.params.get("obstacles", []))
 
@@ -156,38 +209,60 @@ class CrowdModel(mesa.Model):
                 self.schedule.add(new_agent)
                 new_agent.destination = self.random.choice(self.destinations)
 
-    # def count_intruders(self):
-    #     zones = {
-    #         "intimate": 2,
-    #         "personal": 5,
-    #         "social": 8
-    #     }
-    #
-    #     zone_counts = {zone: 0 for zone in zones}
-    #
-    #     for agent in self.schedule.agents:
-    #         for other_agent in self.schedule.agents:
-    #             if agent != other_agent:
-    #                 distance = ((agent.pos[0] - other_agent.pos[0]) ** 2 +
-    #                             (agent.pos[1] - other_agent.pos[1]) ** 2) ** 0.5
-    #                 for zone, radius in zones.items():
-    #                     if distance <= radius:
-    #                         zone_counts[zone] += 1
-    #                         break
-    #     for zone in zones:
-    #         self.intruders_history[zone].append(zone_counts[zone])
+    def count_intruders(self):
+        # one batched cell-list query per step, its positions also drive social distance moves
+        positions = [agent.pos for agent in self.schedule.agents if agent.pos is not None]
+        self.proxemic_index.build(positions)
+
+        for zone, count in self.proxemic_index.zone_totals().items():
+            self.intruders_history[zone].append(count)
 
     def step(self):
         self.next_positions.clear()
+        self.agents_in_step = len(self.schedule.agents)
+        self.moves_in_step = 0
+        self.exits_in_step = 0
+        self.count_intruders()
         self.schedule.step()
+        self.record_collisions()
+        self.measurements.end_step()
+        if self.router is not None:
+            self.router.end_step()
+
+    def step_metrics(self):
+        neck_agents = sum(1 for cell in self.neck_cells if not self.grid.is_cell_empty(cell))
+        return {
+            "step": self.schedule.steps,
+            "agents_remaining": len(self.schedule.agents),
+            "exits": self.exits_in_step,
+            "mean_speed": self.moves_in_step / self.agents_in_step if self.agents_in_step else 0.0,
+            "blocked_moves": self.agents_in_step - self.exits_in_step - self.moves_in_step,
+            "collisions": self.collision_history[-1] if self.collision_history else 0,
+            "neck_density": neck_agents / len(self.neck_cells) if self.neck_cells else 0.0,
+        }
+
+    def catch_up_sleeping_agents(self):
+        # also agents woken after their turn in the last step, they have not replayed their sleep yet
+        for agent in self.schedule.agents:
+            if agent.caught_up_to is not None:
+                agent.catch_up(self.schedule.steps - 1)
+
+    def record_collisions(self):
+        self.step_collisions += self.standing_collisions
+        total_collisions = int(self.step_collisions.sum())
+        self.collision_history.append(total_collisions)
+        if total_collisions:
+            self.collision_count += self.step_collisions
+            self.step_collisions.fill(0)
 
-        # total_collisions = sum(self.collision_count.values())
-        # self.collision_history.append(total_collisions)
+        for pos in self.pending_collisions:
+            self.standing_collisions[pos] += 1
+        self.pending_collisions.clear()
 
     def get_place_for_agent(self):
         while True:
             x = self.random.randrange(self.agents_start_positions['width'][0], self.agents_start_positions['width'][1])
             y = self.random.randrange(self.agents_start_positions['height'][0],
                                       self.agents_start_positions['height'][1])
-            if self.grid.is_cell_empty((x, y)) and (x, y) not in self.obstacles:
+            if self.grid.is_cell_empty((x, y)) and (x, y) not in self.obstacle_positions:
                 return x, y
@@ -0,0 +1,152 @@
+import glob
+import importlib.util
+import json
+import os
+import queue
+import threading
+
+import pandas as pd
+
+EXPORTS_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'exports')
+EXPORT_FORMATS = ("csv", "parquet", "feather")
+POSITION_COLUMNS = ["step", "agent_id", "x", "y"]
+
+
+class RunExporter:
+    # Streams per-step metrics (and optionally agent positions) of a run to batched
+    # columnar files. Batches are handed to a background writer thread through a
+    # bounded queue, so a slow disk throttles the simulation instead of growing memory.
+
+    def __init__(self, model, folder=None, file_format="csv", positions=False,
+                 batch_size=500, positions_batch_size=100000, max_pending_batches=8):
+        if file_format not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown export format {file_format!r}, expected one of {EXPORT_FORMATS}")
+        # checked here, not in the writer thread, where it would only surface later from record()
+        if file_format != "csv" and importlib.util.find_spec("pyarrow") is None:
+            raise ImportError(f"Exporting to {file_format} needs pyarrow, install it or use csv")
+
+        self.folder = os.path.join(folder or EXPORTS_FOLDER, model.run_id)
+        self.file_format = file_format
+        self.with_positions = positions
+        self.batch_size = batch_size
+        self.positions_batch_size = positions_batch_size
+
+        self.metrics = []
+        self.positions = []
+        self.parts = {"metrics": 0, "positions": 0}
+        self.error = None
+
+        os.makedirs(self.folder, exist_ok=True)
+        with open(os.path.join(self.folder, "run.json"), "w") as f:
+            json.dump({
+                "run_id": model.run_id,
+                "grid_width": model.grid.width,
+                "grid_height": model.grid.height,
+                "params": model.params,
+                # the cells actually used, randomized presets do not list them in params
+                "obstacles": [list(obstacle.pos) for obstacle in model.obstacles],
+                "objectives": [{"position": list(destination.pos), "color": list(destination.color)}
+                               for destination in model.destinations],
+            }, f)
+
+        self.batches = queue.Queue(maxsize=max_pending_batches)
+        self.writer = threading.Thread(target=self.write_batches, daemon=True)
+        self.writer.start()
+
+        # the starting positions, a replay begins from the same frame as the simulation
+        if self.with_positions:
+            self.record_positions(model)
+
+    @classmethod
+    def from_params(cls, model):
+        # "export": false in the preset turns exporting off, a dict overrides the defaults
+        options = model.params.get("export", {})
+        if options is False or options is None:
+            return None
+        return cls(model, **options)
+
+    def record(self, model):
+        if self.error is not None:
+            raise self.error
+
+        self.metrics.append(model.step_metrics())
+        if self.with_positions:
+            self.record_positions(model)
+
+        if len(self.metrics) >= self.batch_size or len(self.positions) >= self.positions_batch_size:
+            self.flush()
+
+    def record_positions(self, model):
+        step = model.schedule.steps
+        for agent in model.schedule.agents:
+            if agent.pos is not None:
+                self.positions.append((step, agent.unique_id, agent.pos[0], agent.pos[1]))
+
+    def flush(self):
+        if self.metrics:
+            self.batches.put(("metrics", self.metrics))
+            self.metrics = []
+        if self.positions:
+            self.batches.put(("positions", self.positions))
+            self.positions = []
+
+    def close(self):
+        self.flush()
+        self.batches.put(None)
+        self.writer.join()
+        if self.error is not None:
+            raise self.error
+
+    def write_batches(self):
+        while True:
+            batch = self.batches.get()
+            if batch is None:
+                return
+            if self.error is not None:
+                # keep draining so the simulation never blocks on a dead writer
+                continue
+
+            table, rows = batch
+            try:
+                if table == "positions":
+                    frame = pd.DataFrame(rows, columns=POSITION_COLUMNS)
+                else:
+                    frame = pd.DataFrame(rows)
+                self.write_frame(table, frame)
+            except Exception as e:
+                self.error = e
+
+    def write_frame(self, table, frame):
+        if self.file_format == "csv":
+            path = os.path.join(self.folder, f"{table}.csv")
+            frame.to_csv(path, mode="a", header=self.parts[table] == 0, index=False)
+        else:
+            table_folder = os.path.join(self.folder, table)
+            os.makedirs(table_folder, exist_ok=True)
+            path = os.path.join(table_folder, f"part-{self.parts[table]:05d}.{self.file_format}")
+            if self.file_format == "parquet":
+                frame.to_parquet(path, index=False)
+            else:
+                frame.to_feather(path)
+        self.parts[table] += 1
+
+
+def iter_run_table(run_folder, table="metrics", chunksize=100000):
+    # reads back one exported table chunk by chunk, whatever format it was written in
+    csv_path = os.path.join(run_folder, f"{table}.csv")
+    if os.path.exists(csv_path):
+        yield from pd.read_csv(csv_path, chunksize=chunksize)
+        return
+
+    paths = sorted(glob.glob(os.path.join(run_folder, table, "part-*")))
+    if not paths:
+        raise FileNotFoundError(f"No exported {table} found in {run_folder}")
+    for path in paths:
+        if path.endswith(".parquet"):
+            yield pd.read_parquet(path)
+        else:
+            yield pd.read_feather(path)
+
+
+def load_run_table(run_folder, table="metrics"):
+    return pd.concat(iter_run_table(run_folder, table), ignore_index=True)
@@ -0,0 +1,126 @@
+class FlowMeasurements:
+    # Virtual measurement lines and areas fed move by move from update_visited_positions. Every lookup is a
+    # dict hit on the moved cells, and only per-window aggregates are kept, never trajectories.
+
+    def __init__(self, lines, areas, window=10, blocked=()):
+        self.window = window
+        blocked = set(blocked)
+        self.line_names = [line["name"] for line in lines]
+        self.line_widths = []
+        # (previous cell, new cell) -> (line index, +1 forward / -1 backward)
+        self.crossings = {}
+        for index, line in enumerate(lines):
+            (x0, y0), (x1, y1) = line["start"], line["end"]
+            if y0 == y1:
+                # horizontal line between rows y0 - 1 and y0
+                cells = [((x, y0 - 1), (x, y0)) for x in range(min(x0, x1), max(x0, x1) + 1)]
+            elif x0 == x1:
+                # vertical line between columns x0 - 1 and x0
+                cells = [((x0 - 1, y), (x0, y)) for y in range(min(y0, y1), max(y0, y1) + 1)]
+            else:
+                raise ValueError(f"Measurement line {line['name']!r} must be horizontal or vertical")
+            # only the walkable part of a line counts towards its width
+            cells = [(before, after) for before, after in cells if before not in blocked and after not in blocked]
+            for before, after in cells:
+                self.crossings[(before, after)] = (index, 1)
+                self.crossings[(after, before)] = (index, -1)
+            self.line_widths.append(max(len(cells), 1))
+
+        self.area_names = [area["name"] for area in areas]
+        self.area_sizes = []
+        self.areas_of_cell = {}
+        for index, area in enumerate(areas):
+            cells = [(x, y) for x in range(*area["width"]) for y in range(*area["height"]) if (x, y) not in blocked]
+            for cell in cells:
+                self.areas_of_cell.setdefault(cell, []).append(index)
+            self.area_sizes.append(len(cells))
+
+        self.step = 0
+        self.area_counts = [0] * len(areas)
+        self.line_totals = [0] * len(lines)
+        self.last_crossing = [None] * len(lines)
+        self.headways = [{} for _ in lines]
+        self.windows = []
+        self.reset_window()
+
+    @classmethod
+    def from_params(cls, params, grid_width, grid_height, neck_area, blocked=()):
+        # without any configuration the hourglass neck is measured: a line across the middle row and the neck area
+        lines = params.get("measurement_lines", [
+            {"name": "neck", "start": [0, grid_height // 2], "end": [grid_width - 1, grid_height // 2]},
+        ])
+        areas = params.get("measurement_areas", [dict(neck_area, name="neck")])
+        return cls(lines, areas, params.get("measurement_window", 10), blocked)
+
+    def reset_window(self):
+        self.steps_in_window = 0
+        self.window_crossings = [0] * len(self.line_names)
+        self.window_occupancy = [0] * len(self.area_names)
+        self.window_moves = [0] * len(self.area_names)
+
+    def record_enter(self, pos):
+        for area in self.areas_of_cell.get(pos, ()):
+            self.area_counts[area] += 1
+
+    def record_leave(self, pos):
+        for area in self.areas_of_cell.get(pos, ()):
+            self.area_counts[area] -= 1
+
+    def record_move(self, old_pos, new_pos):
+        crossing = self.crossings.get((old_pos, new_pos))
+        if crossing is not None:
+            line, direction = crossing
+            self.window_crossings[line] += direction
+            self.line_totals[line] += direction
+            if direction > 0:
+                last = self.last_crossing[line]
+                if last is not None:
+                    headway = self.step - last
+                    self.headways[line][headway] = self.headways[line].get(headway, 0) + 1
+                self.last_crossing[line] = self.step
+
+        for area in self.areas_of_cell.get(old_pos, ()):
+            self.area_counts[area] -= 1
+            self.window_moves[area] += 1
+        for area in self.areas_of_cell.get(new_pos, ()):
+            self.area_counts[area] += 1
+
+    def end_step(self):
+        for area, count in enumerate(self.area_counts):
+            self.window_occupancy[area] += count
+        self.step += 1
+        self.steps_in_window += 1
+        if self.steps_in_window == self.window:
+            self.close_window()
+
+    def finish(self):
+        # the last window of a run is usually shorter, it is closed when the windows are read
+        if self.steps_in_window:
+            self.close_window()
+
+    def close_window(self):
+        for line, name in enumerate(self.line_names):
+            self.windows.append({
+                "step": self.step,
+                "kind": "line",
+                "name": name,
+                "flow": self.window_crossings[line] / self.steps_in_window,
+                "specific_flow": self.window_crossings[line] / (self.steps_in_window * self.line_widths[line]),
+            })
+
+        for area, name in enumerate(self.area_names):
+            occupancy = self.window_occupancy[area]
+            density = occupancy / (self.steps_in_window * self.area_sizes[area]) if self.area_sizes[area] else 0.0
+            speed = self.window_moves[area] / occupancy if occupancy else 0.0
+            self.windows.append({
+                "step": self.step,
+                "kind": "area",
+                "name": name,
+                "density": density,
+                "speed": speed,
+                "specific_flow": density * speed,
+            })
+        self.reset_window()
+
+    def headways_by_line(self):
+        return {name: dict(self.headways[line]) for line, name in enumerate(self.line_names)}
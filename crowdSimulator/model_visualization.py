@@ -4,9 +4,11 @@ import pygame
 import random
 from param_choice import ParamsChoice
 from crowd_model import CrowdModel
-from statistics import Statistics
-from statistics import *
-from matplotlib.backends.backend_agg import FigureCanvasAgg as FigureCanvas
+from exporter import RunExporter
+from statistics import (Statistics, STATS_CACHE_FOLDER, FIGURE_NAMES, init_figure_worker, render_worker_figure,
+                        save_snapshot, load_snapshot, cached_runs)
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
 import io
 import cv2
 
@@ -102,8 +104,10 @@ class SimulationVisualization:
             self.screen.blit(logo_image, (logo_rect.x, logo_rect.y))
 
             start_rect = pygame.Rect(120, logo_rect.bottom + 20, 270, 50)
+            stats_rect = pygame.Rect(120, start_rect.bottom + 20, 270, 50)
 
             self.draw_button("Start visualization", start_rect, (208, 168, 52))
+            self.draw_button("Saved statistics", stats_rect, (128, 128, 128))
 
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
@@ -112,20 +116,54 @@ class SimulationVisualization:
                 if event.type == pygame.MOUSEBUTTONDOWN:
                     if start_rect.collidepoint(event.pos):
                         return "Start"
+                    if stats_rect.collidepoint(event.pos):
+                        return "Statistics"
 
             pygame.display.flip()
             self.clock.tick(60)
 
     def run(self):
         scenario = self.menu()
+        if scenario == "Statistics":
+            run_id = self.choose_cached_run()
+            if run_id is not None:
+                self.show_statistics_in_pygame(run_id)
+            return
         self.run_scenario(scenario)
 
+    def choose_cached_run(self):
+        # the most recent runs whose statistics were shown before
+        run_ids = cached_runs()[:12]
+        font = pygame.font.Font(None, 30)
+        while True:
+            self.screen.fill((230, 230, 230))
+            if not run_ids:
+                label = font.render("Brak zapisanych statystyk", True, (0, 0, 0))
+                self.screen.blit(label, (50, 50))
+            rects = [pygame.Rect(50, 50 + idx * 50, 700, 40) for idx in range(len(run_ids))]
+            for run_id, rect in zip(run_ids, rects):
+                pygame.draw.rect(self.screen, (200, 200, 200), rect)
+                self.screen.blit(font.render(run_id, True, (0, 0, 0)), (rect.x + 10, rect.y + 10))
+
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    pygame.quit()
+                    return None
+                if event.type == pygame.MOUSEBUTTONDOWN:
+                    for run_id, rect in zip(run_ids, rects):
+                        if rect.collidepoint(event.pos):
+                            return run_id
+
+            pygame.display.flip()
+            self.clock.tick(60)
+
     def run_scenario(self, scenario):
         running = True
 
         params = ParamsChoice()
-        directory = f"presets/{params.menu()}"
+        directory = os.path.join(params.presets_folder, params.menu())
         self.model = CrowdModel(directory, scenario)
+        exporter = RunExporter.from_params(self.model)
 
         window_width = 1200
         window_height = 700
@@ -175,7 +213,8 @@ class SimulationVisualization:
             self.clock.tick(900)
 
             self.model.step()
-            # self.model.count_intruders()
+            if exporter is not None:
+                exporter.record(self.model)
 
             # if random.randint(1, 20) >= 17:
             #     self.model.spawn_agent()
@@ -184,40 +223,43 @@ class SimulationVisualization:
                 running = False
 
         cap.release()
+        if exporter is not None:
+            exporter.close()
         self.show_statistics_in_pygame()
         pygame.quit()
 
-    def show_statistics_in_pygame(self):
-        stats = Statistics()
-
-        fig1 = stats.plot_space_frequency(self.model.visited_counts, self.model.grid.width,
-                                                     self.model.grid.height)
-        fig2 = stats.plot_collision_history(self.model.collision_history)
-        fig3 = stats.plot_intruders_by_zone(self.model.intruders_history)
-        fig4 = stats.plot_most_used_paths(self.model.path_counts, self.model.grid.width,
-                                                     self.model.grid.height)
-        fig5 = stats.plot_wall_clusters(self.model.agents, self.model.grid.width,
-                                                     self.model.grid.height)
-        self.add_plot(fig1)
-        self.add_plot(fig2)
-        self.add_plot(fig3)
-        self.add_plot(fig4)
-        self.add_plot(fig5)
-
-        self.show_plots()
-
-    def figure_to_surface(self, fig):
-
-        canvas = FigureCanvas(fig)
-        canvas.draw()
-        width, height = canvas.get_width_height()
-        buf = canvas.buffer_rgba()
-        surface = pygame.image.frombuffer(buf, (width, height), "RGBA")
+    def show_statistics_in_pygame(self, run_id=None):
+        run_id = run_id or self.model.run_id
+        cache_folder = os.path.join(STATS_CACHE_FOLDER, run_id)
+        os.makedirs(cache_folder, exist_ok=True)
+        paths = [os.path.join(cache_folder, f"{name}.png") for name in FIGURE_NAMES]
 
-        return surface
+        snapshot = None
+        if self.model is not None and self.model.run_id == run_id:
+            snapshot = Statistics.snapshot(self.model)
+            save_snapshot(snapshot, cache_folder)
 
-    def add_plot(self, fig):
-        surface = self.figure_to_surface(fig)
+        # figures of a run that was already shown come straight from the cache
+        self.plots = [self.load_plot(path) if os.path.exists(path) else None for path in paths]
+        self.current_plot_index = 0
+        missing = [i for i, plot in enumerate(self.plots) if plot is None]
+        if not missing:
+            self.show_plots()
+            return
+
+        snapshot = snapshot or load_snapshot(cache_folder)
+        # every worker is a fresh interpreter importing matplotlib, so never more of them than cores
+        pool = ProcessPoolExecutor(max_workers=min(len(missing), os.cpu_count() or 1),
+                                   mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=init_figure_worker, initargs=(snapshot,))
+        pending = {pool.submit(render_worker_figure, FIGURE_NAMES[i], paths[i]): i for i in missing}
+        try:
+            self.show_plots(pending)
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def load_plot(self, path):
+        surface = pygame.image.load(path)
         # scale plot surface down if it's larger than the window
         win_w, win_h = self.screen.get_size()
         surf_w, surf_h = surface.get_size()
@@ -228,17 +270,25 @@ class SimulationVisualization:
             new_size = (int(surf_w * scale), int(surf_h * scale))
             surface = pygame.transform.smoothscale(surface, new_size)
 
-        self.plots.append(surface)
+        return surface
 
-    def show_plots(self):
+    def show_plots(self, pending=None):
         running = True
+        pending = dict(pending or {})
+        font = pygame.font.Font(None, 36)
 
         while running:
             self.screen.fill((255, 255, 255))
 
+            # show every figure as soon as its worker is done with it
+            for future in [future for future in pending if future.done()]:
+                self.plots[pending.pop(future)] = self.load_plot(future.result())
+
             if self.plots:
                 plot_surface = self.plots[self.current_plot_index]
                 win_w, win_h = self.screen.get_size()
+                if plot_surface is None:
+                    plot_surface = font.render("Generowanie wykresu...", True, (0, 0, 0))
                 plot_rect = plot_surface.get_rect(center=(win_w // 2, win_h // 2))
                 self.screen.blit(plot_surface, plot_rect.topleft)
 
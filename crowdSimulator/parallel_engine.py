@@ -0,0 +1,396 @@
+import argparse
+import multiprocessing
+import threading
+import time
+import traceback
+from multiprocessing import shared_memory
+from multiprocessing.connection import wait
+
+import numpy as np
+
+from scenario_generator import Scenario
+
+EMPTY = 0
+OBSTACLE = -1
+EXIT = -1
+
+# Every array of the engine lives in one of these, cells are indexed [y, x] so a strip of rows is contiguous
+CELL_ARRAYS = {"occupancy": np.int32, "next_occupancy": np.int32, "visited": np.int64, "collisions": np.int64}
+AGENT_ARRAYS = {
+    "pos_x": np.int32, "pos_y": np.int32,
+    "target_x": np.int32, "target_y": np.int32,
+    "dest_x": np.int32, "dest_y": np.int32,
+    "won": np.int8, "active": np.int8,
+}
+
+
+class GridState:
+    # Cell and agent arrays of the engine, either private numpy arrays or views on shared memory blocks.
+
+    def __init__(self, width, height, num_agents, num_workers, shared=False, names=None):
+        self.width = width
+        self.height = height
+        self.num_agents = num_agents
+        self.blocks = []
+        self.owner = shared and names is None
+
+        specs = {name: ((height, width), dtype) for name, dtype in CELL_ARRAYS.items()}
+        specs.update({name: ((num_agents,), dtype) for name, dtype in AGENT_ARRAYS.items()})
+        specs["exits"] = ((num_workers,), np.int64)
+
+        self.names = {}
+        for name, (shape, dtype) in specs.items():
+            size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+            if not shared:
+                array = np.zeros(shape, dtype=dtype)
+            else:
+                if names is None:
+                    block = shared_memory.SharedMemory(create=True, size=max(size, 1))
+                else:
+                    # spawned workers share the creator's resource tracker, only the creator unlinks
+                    block = shared_memory.SharedMemory(name=names[name])
+                self.blocks.append(block)
+                self.names[name] = block.name
+                array = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+                if names is None:
+                    array.fill(0)
+            setattr(self, name, array)
+
+    def close(self):
+        for name in list(CELL_ARRAYS) + list(AGENT_ARRAYS) + ["exits"]:
+            setattr(self, name, None)
+        for block in self.blocks:
+            block.close()
+            if self.owner:
+                block.unlink()
+        self.blocks = []
+
+
+def propose(state, y0, y1):
+    # Phase 1: every agent in rows [y0, y1) picks a target from the occupancy at the start of the step,
+    # with the same preferences as CrowdAgent.get_next_position. Reads one halo row below the strip.
+    width, height = state.width, state.height
+    occupancy = state.occupancy
+    ys, xs = np.nonzero(occupancy[y0:y1] > 0)
+    ys = ys.astype(np.int32) + y0
+    xs = xs.astype(np.int32)
+    ids = occupancy[ys, xs] - 1
+
+    def is_free(x, y):
+        inside = (x >= 0) & (x < width) & (y >= 0) & (y < height)
+        cells = occupancy[np.clip(y, 0, height - 1), np.clip(x, 0, width - 1)]
+        return inside & (cells == EMPTY)
+
+    down_ok = is_free(xs, ys + 1)
+    right_ok = is_free(xs + 1, ys)
+    left_ok = is_free(xs - 1, ys)
+
+    last_row = ys == height - 1
+    go_down = ~last_row & down_ok
+    go_right = np.where(last_row, xs < width // 2, ~down_ok) & right_ok
+    go_left = np.where(last_row, xs >= width // 2, ~down_ok & ~right_ok) & left_ok
+
+    target_x = xs + go_right - go_left
+    target_y = ys + go_down
+
+    finished = (xs == state.dest_x[ids]) & (ys == state.dest_y[ids])
+    target_x[finished] = EXIT
+    target_y[finished] = EXIT
+
+    state.target_x[ids] = target_x
+    state.target_y[ids] = target_y
+    return ids, xs, ys
+
+
+def resolve(state, y0, y1, worker):
+    # Phase 2: the owner of a cell settles every move into it. The lowest agent id wins, the others
+    # stay and count a collision on the cell. Moves into the strip come from its rows or the row above.
+    width = state.width
+    occupancy, next_occupancy = state.occupancy, state.next_occupancy
+    next_occupancy[y0:y1] = occupancy[y0:y1]
+
+    top = max(y0 - 1, 0)
+    ys, xs = np.nonzero(occupancy[top:y1] > 0)
+    ys = ys + top
+    ids = occupancy[ys, xs] - 1
+    target_x, target_y = state.target_x[ids], state.target_y[ids]
+
+    own = ys >= y0
+    leaving = own & (target_x == EXIT)
+    next_occupancy[ys[leaving], xs[leaving]] = EMPTY
+    state.active[ids[leaving]] = 0
+    state.exits[worker] += int(leaving.sum())
+
+    staying = own & (target_x == xs) & (target_y == ys)
+    state.visited[ys[staying], xs[staying]] += 1
+
+    moving = (target_x != EXIT) & ((target_x != xs) | (target_y != ys)) & (target_y >= y0) & (target_y < y1)
+    ids, target_x, target_y = ids[moving], target_x[moving], target_y[moving]
+    if len(ids) == 0:
+        return
+
+    cells = target_y.astype(np.int64) * width + target_x
+    order = np.lexsort((ids, cells))
+    ids, cells, target_x, target_y = ids[order], cells[order], target_x[order], target_y[order]
+    first = np.ones(len(cells), dtype=bool)
+    first[1:] = cells[1:] != cells[:-1]
+
+    next_occupancy[target_y[first], target_x[first]] = ids[first] + 1
+    state.won[ids[first]] = 1
+    state.visited[target_y[first], target_x[first]] += 1
+    np.add.at(state.collisions, (target_y[~first], target_x[~first]), 1)
+
+
+def commit(state, y0, y1, proposals):
+    # Phase 3: winners leave their old cells and the strip's new occupancy becomes current.
+    ids, xs, ys = proposals
+    won = state.won[ids] == 1
+    state.next_occupancy[ys[won], xs[won]] = EMPTY
+    state.pos_x[ids[won]] = state.target_x[ids[won]]
+    state.pos_y[ids[won]] = state.target_y[ids[won]]
+    state.won[ids] = 0
+    state.occupancy[y0:y1] = state.next_occupancy[y0:y1]
+
+
+def run_worker(names, width, height, num_agents, num_workers, y0, y1, worker, barrier, connection):
+    state = GridState(width, height, num_agents, num_workers, shared=True, names=names)
+    try:
+        while True:
+            steps = connection.recv()
+            if steps is None:
+                break
+            try:
+                for _ in range(steps):
+                    proposals = propose(state, y0, y1)
+                    barrier.wait()
+                    resolve(state, y0, y1, worker)
+                    barrier.wait()
+                    commit(state, y0, y1, proposals)
+                    barrier.wait()
+            except Exception as e:
+                # release the other workers from the barrier, they report a broken barrier in turn
+                barrier.abort()
+                connection.send(("error", isinstance(e, threading.BrokenBarrierError), traceback.format_exc()))
+                break
+            connection.send(("done", False, steps))
+    finally:
+        state.close()
+
+
+class ParallelCrowdEngine:
+    # Steps the cellular hourglass rule on a grid split into horizontal strips, one worker process per
+    # strip. Agents are handed over between strips implicitly: whoever owns the row an agent stands on
+    # moves it. Moves are decided from the occupancy at the start of the step and conflicts go to the
+    # lowest agent id, so the result does not depend on the number of workers; workers=1 runs the same
+    # phases in this process and is the reference path.
+
+    def __init__(self, width, height, agent_positions, agent_destinations, obstacle_positions, workers=1):
+        self.width = width
+        self.height = height
+        self.workers = max(1, min(workers, height))
+        self.steps = 0
+
+        agent_positions = np.asarray(agent_positions, dtype=np.int32).reshape(-1, 2)
+        agent_destinations = np.asarray(agent_destinations, dtype=np.int32).reshape(-1, 2)
+        obstacle_positions = np.asarray(obstacle_positions, dtype=np.int32).reshape(-1, 2)
+        self.num_agents = len(agent_positions)
+
+        self.state = GridState(width, height, self.num_agents, self.workers, shared=self.workers > 1)
+        self.state.occupancy[obstacle_positions[:, 1], obstacle_positions[:, 0]] = OBSTACLE
+        self.state.occupancy[agent_positions[:, 1], agent_positions[:, 0]] = np.arange(1, self.num_agents + 1)
+        self.state.pos_x[:] = agent_positions[:, 0]
+        self.state.pos_y[:] = agent_positions[:, 1]
+        self.state.dest_x[:] = agent_destinations[:, 0]
+        self.state.dest_y[:] = agent_destinations[:, 1]
+        self.state.active[:] = 1
+
+        bounds = np.linspace(0, height, self.workers + 1).astype(int)
+        self.strips = list(zip(bounds[:-1], bounds[1:]))
+        self.processes = []
+        self.connections = []
+        self.failed = False
+        if self.workers > 1:
+            self.start_workers()
+
+    @classmethod
+    def from_params(cls, params, seed=None, workers=1):
+        rng = np.random.default_rng(seed)
+        width = params.get("grid_width", 30)
+        height = params.get("grid_height", 30)
+        start = params.get("agent_start_positions", {"width": [0, width], "height": [0, height]})
+
+        obstacles = np.array([obstacle["position"] for obstacle in params.get("obstacles", [])],
+                             dtype=np.int32).reshape(-1, 2)
+        blocked = np.zeros((height, width), dtype=bool)
+        blocked[obstacles[:, 1], obstacles[:, 0]] = True
+
+        free = np.zeros_like(blocked)
+        free[start["height"][0]:start["height"][1], start["width"][0]:start["width"][1]] = True
+        free &= ~blocked
+        free_cells = np.flatnonzero(free)
+        num_agents = min(params.get("num_agents", 10), len(free_cells))
+        cells = rng.choice(free_cells, size=num_agents, replace=False)
+        agent_positions = np.stack([cells % width, cells // width], axis=1)
+
+        exits = np.array([objective["position"] for objective in params.get("objectives", [])],
+                         dtype=np.int32).reshape(-1, 2)
+        agent_destinations = exits[rng.integers(len(exits), size=num_agents)]
+
+        return cls(width, height, agent_positions, agent_destinations, obstacles, workers)
+
+    @classmethod
+    def from_scenario(cls, scenario, seed=None, workers=1):
+        # a Scenario from scenario_generator, already populated; every agent heads for a random exit
+        rng = np.random.default_rng(seed)
+        agent_destinations = scenario.exits[rng.integers(len(scenario.exits), size=len(scenario.agents))]
+        return cls(scenario.width, scenario.height, scenario.agents, agent_destinations,
+                   scenario.blocked_positions(), workers)
+
+    @classmethod
+    def from_model(cls, model, workers=1):
+        agents = [agent for agent in model.schedule.agents if agent.pos is not None]
+        return cls(model.grid.width, model.grid.height,
+                   [agent.pos for agent in agents],
+                   [agent.destination.pos for agent in agents],
+                   [obstacle.pos for obstacle in model.obstacles],
+                   workers)
+
+    def start_workers(self):
+        context = multiprocessing.get_context("spawn")
+        # kept on the engine, the semaphore behind it has to outlive the start of every worker
+        self.barrier = context.Barrier(self.workers)
+        for worker, (y0, y1) in enumerate(self.strips):
+            parent_end, child_end = context.Pipe()
+            process = context.Process(
+                target=run_worker,
+                args=(self.state.names, self.width, self.height, self.num_agents, self.workers,
+                      y0, y1, worker, self.barrier, child_end),
+                daemon=True)
+            process.start()
+            self.processes.append(process)
+            self.connections.append(parent_end)
+
+    def run(self, steps):
+        if self.workers == 1:
+            for _ in range(steps):
+                proposals = propose(self.state, 0, self.height)
+                resolve(self.state, 0, self.height, 0)
+                commit(self.state, 0, self.height, proposals)
+        else:
+            if self.failed:
+                raise RuntimeError("A worker of this engine failed, the grid state is no longer consistent")
+            for connection in self.connections:
+                connection.send(steps)
+            self.wait_for_workers()
+        self.steps += steps
+
+    def wait_for_workers(self):
+        # a worker that raises or dies must not leave the others and this process waiting forever
+        pending = dict(enumerate(self.connections))
+        errors = {}
+        while pending:
+            ready = wait(list(pending.values()) + [self.processes[worker].sentinel for worker in pending])
+            for worker, connection in list(pending.items()):
+                if connection in ready or connection.poll():
+                    try:
+                        status, broken_barrier, detail = connection.recv()
+                    except EOFError:
+                        status, broken_barrier, detail = "error", False, "the worker closed its pipe"
+                elif self.processes[worker].sentinel in ready:
+                    status, broken_barrier = "error", False
+                    detail = f"the worker exited with code {self.processes[worker].exitcode}"
+                else:
+                    continue
+                del pending[worker]
+                if status == "error":
+                    errors[worker] = (broken_barrier, detail)
+                    self.barrier.abort()
+
+        if errors:
+            self.failed = True
+            # the worker that failed first, not the ones only released from the barrier
+            worker, (_, detail) = min(errors.items(), key=lambda item: (item[1][0], item[0]))
+            raise RuntimeError(f"Parallel engine worker {worker} failed:\n{detail}")
+
+    def step(self):
+        self.run(1)
+
+    @property
+    def agents_remaining(self):
+        return int(self.state.active.sum())
+
+    @property
+    def exits(self):
+        return int(self.state.exits.sum())
+
+    # per-cell statistics in the [x, y] layout of CrowdModel.collision_count
+    def visited_counts(self):
+        return self.state.visited.T.copy()
+
+    def collision_count(self):
+        return self.state.collisions.T.copy()
+
+    def close(self):
+        for connection in self.connections:
+            try:
+                connection.send(None)
+            except OSError:
+                # the worker already stopped after an error
+                pass
+        for process in self.processes:
+            process.join()
+        self.processes = []
+        self.connections = []
+        self.state.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def benchmark_params(size, density):
+    return {
+        "num_agents": int(size * size // 2 * density),
+        "grid_width": size,
+        "grid_height": size,
+        "agent_start_positions": {"width": [0, size], "height": [0, size // 2]},
+        "objectives": [{"position": [x, size - 1]} for x in range(size)],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the speedup of the strip-parallel engine.")
+    parser.add_argument("--size", type=int, default=2000)
+    parser.add_argument("--density", type=float, default=0.3)
+    parser.add_argument("--steps", type=int, default=20)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--scenario", help="compiled .npz layout from scenario_generator, replaces --size/--density")
+    args = parser.parse_args()
+
+    if args.scenario:
+        scenario = Scenario.load(args.scenario)
+        create_engine = lambda workers: ParallelCrowdEngine.from_scenario(scenario, args.seed, workers)
+    else:
+        params = benchmark_params(args.size, args.density)
+        create_engine = lambda workers: ParallelCrowdEngine.from_params(params, args.seed, workers)
+    reference = None
+    baseline = None
+    for workers in args.workers:
+        with create_engine(workers) as engine:
+            start = time.perf_counter()
+            engine.run(args.steps)
+            elapsed = time.perf_counter() - start
+            visited, collisions = engine.visited_counts(), engine.collision_count()
+
+        if reference is None:
+            reference, baseline = (visited, collisions), elapsed
+        same = np.array_equal(reference[0], visited) and np.array_equal(reference[1], collisions)
+        print(f"workers={workers}: {elapsed:.2f}s, speedup {baseline / elapsed:.2f}x, "
+              f"statistics {'match' if same else 'DIFFER'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,8 @@ import os
 import json
 import random
 
+PRESETS_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'presets')
+
 
 class ParamsChoice:
     def __init__(self):
@@ -12,7 +14,7 @@ class ParamsChoice:
         pygame.font.init()
         self.font = pygame.font.SysFont("Arial", 20)
 
-        self.presets_folder = 'presets'
+        self.presets_folder = PRESETS_FOLDER
         self.files = self.load_presets()
 
     def load_presets(self):
@@ -41,6 +43,7 @@ class ParamsChoice:
                 {"position": [i, 29], "preset": "exit", "color": [0, 0, 128]} for i in range(0, 30)                
             ],
             "randomize_obstacles": True,
+            "movement_mode": "routing",
             "grid_width": 30,
             "grid_height": 30,
         }
@@ -86,7 +89,7 @@ class ParamsChoice:
 
                     if random_button_rect.collidepoint(event.pos):
                         random_params = self.create_random_params()
-                        random_params_file = "crowdSimulator/presets/random_params.json"
+                        random_params_file = os.path.join(self.presets_folder, "random_params.json")
                         with open(random_params_file, "w") as f:
                             json.dump(random_params, f)
                         return "random_params.json"
@@ -0,0 +1,111 @@
+import numpy as np
+
+# Hall's proxemic zones measured in grid cells
+ZONES = {"intimate": 2, "personal": 5, "social": 8}
+ZONE_WEIGHTS = {"intimate": 10.0, "personal": 3.0, "social": 1.0}
+
+NEIGHBOUR_CELLS = [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)]
+
+
+# Cell list over agent positions, rebuilt once per step. Bins are one cell wider
+# than the social radius, so the 3x3 block of bins around a position also covers
+# everything a one-cell move can reach.
+class ProxemicIndex:
+
+    def __init__(self, zones=None, weights=None):
+        zones = zones or ZONES
+        weights = weights or ZONE_WEIGHTS
+        self.zone_names = sorted(zones, key=zones.get)
+        self.radii = np.array([zones[zone] for zone in self.zone_names], dtype=float)
+        # cells outside of every zone cost nothing
+        self.weights = np.array([weights.get(zone, 0.0) for zone in self.zone_names] + [0.0])
+        self.bin_size = int(np.ceil(self.radii.max())) + 1
+
+        self.positions = np.empty((0, 2), dtype=np.int64)
+        self.keys = np.empty(0, dtype=np.int64)
+        self.order = np.empty(0, dtype=np.int64)
+        self.sorted_keys = np.empty(0, dtype=np.int64)
+        self.stride = 3
+
+    def _bin_keys(self, bins):
+        # bins are shifted by one so that neighbours of border bins keep non-negative keys
+        return (bins[..., 0] + 1) * self.stride + (bins[..., 1] + 1)
+
+    def build(self, positions):
+        self.positions = np.asarray(positions, dtype=np.int64).reshape(-1, 2)
+        bins = self.positions // self.bin_size
+        self.stride = int(bins[:, 1].max()) + 3 if len(bins) else 3
+        self.keys = self._bin_keys(bins)
+        self.order = np.argsort(self.keys, kind="stable")
+        self.sorted_keys = self.keys[self.order]
+
+    def _pairs(self):
+        n = len(self.positions)
+        agents = np.arange(n)
+        firsts, seconds = [], []
+
+        for dx, dy in NEIGHBOUR_CELLS:
+            target = self.keys + dx * self.stride + dy
+            start = np.searchsorted(self.sorted_keys, target, side="left")
+            counts = np.searchsorted(self.sorted_keys, target, side="right") - start
+            total = int(counts.sum())
+            if total == 0:
+                continue
+
+            within = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+            firsts.append(np.repeat(agents, counts))
+            seconds.append(self.order[np.repeat(start, counts) + within])
+
+        if not firsts:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+        first = np.concatenate(firsts)
+        second = np.concatenate(seconds)
+        distinct = first != second
+        return first[distinct], second[distinct]
+
+    def _zone_of(self, distances):
+        # index of the innermost zone containing the distance, len(radii) if outside all of them
+        return np.searchsorted(self.radii, distances, side="left")
+
+    def zone_counts(self):
+        # intruders per agent and zone, shape (agents, zones)
+        n = len(self.positions)
+        n_zones = len(self.radii)
+        first, second = self._pairs()
+
+        delta = self.positions[first] - self.positions[second]
+        zone = self._zone_of(np.hypot(delta[:, 0], delta[:, 1]))
+        inside = zone < n_zones
+
+        flat = np.bincount(first[inside] * n_zones + zone[inside], minlength=n * n_zones)
+        return flat.reshape(n, n_zones)
+
+    def zone_totals(self):
+        totals = self.zone_counts().sum(axis=0)
+        return {zone: int(total) for zone, total in zip(self.zone_names, totals)}
+
+    def neighbours(self, pos):
+        bin_key = self._bin_keys(np.asarray(pos, dtype=np.int64) // self.bin_size)
+        slices = []
+        for dx, dy in NEIGHBOUR_CELLS:
+            target = bin_key + dx * self.stride + dy
+            start = np.searchsorted(self.sorted_keys, target, side="left")
+            end = np.searchsorted(self.sorted_keys, target, side="right")
+            if end > start:
+                slices.append(self.order[start:end])
+
+        if not slices:
+            return np.empty((0, 2), dtype=np.int64)
+
+        found = self.positions[np.concatenate(slices)]
+        return found[np.any(found != np.asarray(pos), axis=1)]
+
+    def intrusion_cost(self, candidates, neighbours):
+        candidates = np.asarray(candidates, dtype=np.int64).reshape(-1, 2)
+        if len(neighbours) == 0:
+            return np.zeros(len(candidates))
+
+        delta = candidates[:, None, :] - neighbours[None, :, :]
+        zone = self._zone_of(np.hypot(delta[..., 0], delta[..., 1]))
+        return self.weights[zone].sum(axis=1)
@@ -0,0 +1,165 @@
+from collections import deque
+
+import numpy as np
+
+UNREACHABLE = np.iinfo(np.int32).max
+# same preference order as CrowdAgent.get_next_position: down, right, left, then up
+MOVES = [(0, 1), (1, 0), (-1, 0), (0, -1)]
+STAY = -1
+# groups per cell that choose_exit looks at before falling back to all of them
+NEAREST_GROUPS = 4
+
+
+def group_exits(positions):
+    # exits touching each other (also diagonally) share one distance field
+    remaining = set(positions)
+    groups = []
+    while remaining:
+        start = remaining.pop()
+        group = [start]
+        frontier = [start]
+        while frontier:
+            x, y = frontier.pop()
+            for dx in (-1, 0, 1):
+                for dy in (-1, 0, 1):
+                    neighbour = (x + dx, y + dy)
+                    if neighbour in remaining:
+                        remaining.remove(neighbour)
+                        group.append(neighbour)
+                        frontier.append(neighbour)
+        groups.append(sorted(group))
+    return sorted(groups)
+
+
+def distance_field(width, height, sources, blocked):
+    # breadth-first search from all cells of a group at once, indexed [x, y] like the mesa grid
+    field = np.full((width, height), UNREACHABLE, dtype=np.int32)
+    queue = deque()
+    for x, y in sources:
+        field[x, y] = 0
+        queue.append((x, y))
+
+    while queue:
+        x, y = queue.popleft()
+        distance = field[x, y] + 1
+        for dx, dy in MOVES:
+            nx, ny = x + dx, y + dy
+            if 0 <= nx < width and 0 <= ny < height and not blocked[nx, ny] and field[nx, ny] > distance:
+                field[nx, ny] = distance
+                queue.append((nx, ny))
+    return field
+
+
+def next_hop_table(field):
+    width, height = field.shape
+    padded = np.full((width + 2, height + 2), UNREACHABLE, dtype=np.int32)
+    padded[1:-1, 1:-1] = field
+    neighbours = np.stack([padded[1 + dx:width + 1 + dx, 1 + dy:height + 1 + dy] for dx, dy in MOVES])
+    best = neighbours.argmin(axis=0)
+    downhill = neighbours.min(axis=0) < field
+    return np.where(downhill, best, STAY).astype(np.int8)
+
+
+class ExitRouter:
+    # Precomputed routes to every exit group. Following a route is one table lookup per step; choosing an
+    # exit once every route_interval steps weighs the distance plus a congestion term from the queue
+    # lengths cached at the end of the previous step. Groups are tried nearest first from a per-cell table,
+    # so with many separate gates only the few closest ones are usually compared.
+
+    def __init__(self, width, height, destinations, obstacle_positions, route_interval=10,
+                 congestion_weight=1.0, queue_radius=3):
+        self.route_interval = route_interval
+        self.congestion_weight = congestion_weight
+        self.queue_radius = queue_radius
+        self.destination_at = {destination.pos: destination for destination in destinations}
+
+        blocked = np.zeros((width, height), dtype=bool)
+        for x, y in obstacle_positions:
+            blocked[x, y] = True
+
+        self.groups = group_exits(list(self.destination_at))
+        self.fields = [distance_field(width, height, group, blocked) for group in self.groups]
+        self.next_hops = [next_hop_table(field) for field in self.fields]
+        if self.fields:
+            # stable, so groups at the same distance keep their order and ties go to the lower group
+            self.nearest = np.argsort(np.stack(self.fields), axis=0, kind="stable")[:NEAREST_GROUPS]
+        else:
+            self.nearest = np.empty((0, width, height), dtype=np.int64)
+
+        self.queued = {}
+        self.live_queue_lengths = np.zeros(len(self.groups), dtype=np.int64)
+        self.queue_lengths = np.zeros(len(self.groups), dtype=np.int64)
+
+    def choose_exit(self, pos):
+        # congestion only adds to the distance, so once a group is farther than the best cost so far,
+        # neither it nor any group after it can win
+        best_group, best_cost = None, None
+        x, y = pos
+        for group in self.nearest[:, x, y]:
+            distance = self.fields[group][pos]
+            if distance == UNREACHABLE or (best_cost is not None and distance > best_cost):
+                return best_group
+            best_group, best_cost = self.compare_exit(group, distance, best_group, best_cost)
+
+        if len(self.nearest) < len(self.groups):
+            for group, field in enumerate(self.fields):
+                if field[pos] != UNREACHABLE:
+                    best_group, best_cost = self.compare_exit(group, field[pos], best_group, best_cost)
+        return best_group
+
+    def compare_exit(self, group, distance, best_group, best_cost):
+        cost = distance + self.congestion_weight * self.queue_lengths[group]
+        if best_cost is None or cost < best_cost or (cost == best_cost and group < best_group):
+            return group, cost
+        return best_group, best_cost
+
+    def preferred_position(self, group, pos):
+        hop = self.next_hops[group][pos]
+        if hop == STAY:
+            return pos
+        dx, dy = MOVES[hop]
+        return pos[0] + dx, pos[1] + dy
+
+    def next_position(self, group, pos, is_position_valid):
+        hop = self.next_hops[group][pos]
+        if hop == STAY:
+            return pos
+
+        x, y = pos
+        dx, dy = MOVES[hop]
+        if is_position_valid((x + dx, y + dy)):
+            return x + dx, y + dy
+
+        # the best cell is taken, any other cell closer to the exit will do
+        field = self.fields[group]
+        for dx, dy in MOVES:
+            candidate = (x + dx, y + dy)
+            if (0 <= candidate[0] < field.shape[0] and 0 <= candidate[1] < field.shape[1]
+                    and field[candidate] < field[pos] and is_position_valid(candidate)):
+                return candidate
+        return pos
+
+    def at_exit(self, group, pos):
+        return self.fields[group][pos] == 0
+
+    def update_queue(self, agent, group, pos):
+        # agents keep their place in a queue while they sleep, membership only changes when they act
+        queued = group if self.fields[group][pos] <= self.queue_radius else None
+        previous = self.queued.get(agent)
+        if queued == previous:
+            return
+        if previous is not None:
+            self.live_queue_lengths[previous] -= 1
+        if queued is not None:
+            self.live_queue_lengths[queued] += 1
+            self.queued[agent] = queued
+        else:
+            del self.queued[agent]
+
+    def leave(self, agent):
+        previous = self.queued.pop(agent, None)
+        if previous is not None:
+            self.live_queue_lengths[previous] -= 1
+
+    def end_step(self):
+        self.queue_lengths = self.live_queue_lengths.copy()
@@ -0,0 +1,307 @@
+import argparse
+import json
+import os
+
+import numpy as np
+
+BASE_FOLDER = os.path.dirname(os.path.abspath(__file__))
+SCENARIOS_FOLDER = os.path.join(BASE_FOLDER, 'scenarios')
+
+EXIT_COLOR = [0, 0, 128]
+# the standard scaling ladder, 10^2 to 10^6 agents
+SCALING_AGENTS = [10 ** 2, 10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6]
+
+
+class Scenario:
+    # A generated layout: walls, exits and the cells agents may start on as arrays indexed [x, y] like the
+    # mesa grid, plus the obstacles and agents placed by populate(). Everything is derived from the layout
+    # arguments and the seed, so the same call always gives the same scenario.
+
+    def __init__(self, kind, walls, exits, spawn, layout_args):
+        self.kind = kind
+        self.walls = walls
+        self.exits = np.asarray(exits, dtype=np.int32).reshape(-1, 2)
+        # agents never start on an exit, they would leave before taking a step
+        self.spawn = spawn & ~walls & ~self.exit_mask()
+        self.layout_args = layout_args
+        self.seed = None
+        self.obstacles = np.zeros((0, 2), dtype=np.int32)
+        self.agents = np.zeros((0, 2), dtype=np.int32)
+
+    @property
+    def width(self):
+        return self.walls.shape[0]
+
+    @property
+    def height(self):
+        return self.walls.shape[1]
+
+    def exit_mask(self):
+        mask = np.zeros_like(self.walls)
+        mask[self.exits[:, 0], self.exits[:, 1]] = True
+        return mask
+
+    def populate(self, seed=None, density=None, num_agents=None, num_obstacles=0):
+        # distinct cells are drawn in one go: obstacles anywhere walkable, agents on the free spawn cells that
+        # still lead to an exit
+        rng = np.random.default_rng(seed)
+        self.seed = seed
+        connected = reachable(self.walls, self.exits)
+        walkable = np.flatnonzero(~self.walls & ~self.exit_mask())
+        num_obstacles = min(num_obstacles, len(walkable))
+        obstacle_cells = rng.choice(walkable, size=num_obstacles, replace=False)
+        obstacle_cells = self.keep_connected(obstacle_cells, walkable, connected, rng)
+
+        spawn = (self.spawn & connected).ravel()
+        spawn[obstacle_cells] = False
+        spawn_cells = np.flatnonzero(spawn)
+        if num_agents is None:
+            num_agents = int(round((density or 0.0) * len(spawn_cells)))
+        num_agents = min(num_agents, len(spawn_cells))
+        agent_cells = rng.choice(spawn_cells, size=num_agents, replace=False)
+
+        self.obstacles = np.stack(np.unravel_index(obstacle_cells, self.walls.shape), axis=1).astype(np.int32)
+        self.agents = np.stack(np.unravel_index(agent_cells, self.walls.shape), axis=1).astype(np.int32)
+        return self
+
+    def keep_connected(self, obstacle_cells, candidates, connected, rng, max_rounds=100):
+        # obstacles bordering cells they cut off from every exit are drawn again elsewhere, cells that are
+        # rejected once are not drawn again
+        rejected = np.zeros(self.walls.size, dtype=bool)
+        for _ in range(max_rounds):
+            blocked = self.walls.copy().ravel()
+            blocked[obstacle_cells] = True
+            blocked = blocked.reshape(self.walls.shape)
+            cut_off = connected & ~blocked & ~reachable(blocked, self.exits)
+            if not cut_off.any():
+                return obstacle_cells
+
+            padded = np.pad(cut_off, 1)
+            border = (padded[2:, 1:-1] | padded[:-2, 1:-1] | padded[1:-1, 2:] | padded[1:-1, :-2]).ravel()
+            bad = border[obstacle_cells]
+            rejected[obstacle_cells[bad]] = True
+            taken = np.zeros(self.walls.size, dtype=bool)
+            taken[obstacle_cells] = True
+            free = candidates[~rejected[candidates] & ~taken[candidates]]
+            replacements = rng.choice(free, size=min(int(bad.sum()), len(free)), replace=False)
+            obstacle_cells = np.concatenate([obstacle_cells[~bad], replacements])
+        raise ValueError(f"Could not place {len(obstacle_cells)} obstacles without cutting cells off from the exits")
+
+    def blocked_positions(self):
+        walls = np.argwhere(self.walls).astype(np.int32)
+        return np.concatenate([walls, self.obstacles])
+
+    def to_preset(self):
+        obstacles = self.blocked_positions()
+        return {
+            "num_agents": len(self.agents),
+            "num_objectives": len(self.exits),
+            "objectives": [{"position": [int(x), int(y)], "preset": "exit", "color": EXIT_COLOR}
+                           for x, y in self.exits],
+            "num_obstacles": len(obstacles),
+            "obstacles": [{"position": [int(x), int(y)]} for x, y in obstacles],
+            "agent_positions": self.agents.tolist(),
+            "randomize_objectives": False,
+            "randomize_obstacles": False,
+            "movement_mode": "routing",
+            "grid_width": self.width,
+            "grid_height": self.height,
+            "scenario": {"kind": self.kind, "seed": self.seed, **self.layout_args},
+        }
+
+    def save(self, path):
+        # json presets for the pygame menu, compiled .npz layouts for workloads too big to list in json
+        if path.endswith(".json"):
+            with open(path, 'w') as f:
+                json.dump(self.to_preset(), f)
+        else:
+            np.savez_compressed(path, walls=np.packbits(self.walls), exits=self.exits,
+                                spawn=np.packbits(self.spawn), obstacles=self.obstacles, agents=self.agents,
+                                meta=json.dumps({"kind": self.kind, "seed": self.seed, "width": self.width,
+                                                 "height": self.height, "layout_args": self.layout_args}))
+        return path
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            shape = (meta["width"], meta["height"])
+            size = shape[0] * shape[1]
+            walls = np.unpackbits(data["walls"], count=size).reshape(shape).astype(bool)
+            spawn = np.unpackbits(data["spawn"], count=size).reshape(shape).astype(bool)
+            scenario = cls(meta["kind"], walls, data["exits"], spawn, meta["layout_args"])
+            scenario.seed = meta["seed"]
+            scenario.obstacles = data["obstacles"]
+            scenario.agents = data["agents"]
+        return scenario
+
+
+def reachable(blocked, sources):
+    # breadth-first search from the exits like routing.distance_field, but a whole frontier at a time on flat
+    # [x, y] indices, so layouts of millions of cells stay fast
+    width, height = blocked.shape
+    free = ~blocked.ravel()
+    seen = np.zeros(free.size, dtype=bool)
+    frontier = np.ravel_multi_index((sources[:, 0], sources[:, 1]), blocked.shape)
+    frontier = frontier[free[frontier]]
+    seen[frontier] = True
+    while frontier.size:
+        y = frontier % height
+        neighbours = np.concatenate([
+            frontier[y < height - 1] + 1,
+            frontier[y > 0] - 1,
+            frontier[frontier < free.size - height] + height,
+            frontier[frontier >= height] - height,
+        ])
+        frontier = np.unique(neighbours[free[neighbours] & ~seen[neighbours]])
+        seen[frontier] = True
+    return seen.reshape(blocked.shape)
+
+
+def hourglass(width=30, height=30, neck_width=2):
+    # the funnel of ModelVisualization.draw_obstacles, with a neck of any width; agents start in the upper
+    # bulb and leave through the bottom row
+    xs, ys = np.ogrid[:width, :height]
+    half_height = (height - 1) / 2
+    opening = np.maximum(np.abs(ys - half_height) / max(half_height, 1) * width / 2, neck_width / 2)
+    walls = np.abs(xs + 0.5 - width / 2) > opening
+    spawn = np.broadcast_to(ys < height // 2, walls.shape)
+    exits = [(x, height - 1) for x in np.flatnonzero(~walls[:, height - 1])]
+    return Scenario("hourglass", walls, exits, spawn,
+                    {"width": width, "height": height, "neck_width": neck_width})
+
+
+def corridor(length=60, width=6):
+    # a walled corridor running down the grid, entered from the upper third and left through the far end
+    walls = np.zeros((width + 2, length), dtype=bool)
+    walls[[0, -1], :] = True
+    spawn = np.zeros_like(walls)
+    spawn[:, :max(length // 3, 1)] = True
+    exits = [(x, length - 1) for x in range(1, width + 1)]
+    return Scenario("corridor", walls, exits, spawn, {"length": length, "width": width})
+
+
+def rooms(rooms_x=3, rooms_y=3, room_size=8, door_width=2):
+    # a floor of equal rooms with a door in the middle of every inner wall and exits through the doors of
+    # the bottom row of rooms
+    pitch = room_size + 1
+    width, height = rooms_x * pitch + 1, rooms_y * pitch + 1
+    xs, ys = np.ogrid[:width, :height]
+    walls = (xs % pitch == 0) | (ys % pitch == 0)
+
+    # cells of a wall that fall inside a door, measured from the middle of the room side
+    in_door_x = np.abs(xs % pitch - (pitch / 2)) < door_width / 2
+    in_door_y = np.abs(ys % pitch - (pitch / 2)) < door_width / 2
+    inner_x = (xs > 0) & (xs < width - 1)
+    inner_y = (ys > 0) & (ys < height - 1)
+    walls &= ~((ys % pitch == 0) & in_door_x & inner_y)
+    walls &= ~((xs % pitch == 0) & in_door_y & inner_x)
+
+    bottom_doors = np.flatnonzero(np.abs(np.arange(width) % pitch - (pitch / 2)) < door_width / 2)
+    walls[bottom_doors, height - 1] = False
+    exits = [(x, height - 1) for x in bottom_doors]
+    return Scenario("rooms", walls, exits, ~walls, {"rooms_x": rooms_x, "rooms_y": rooms_y,
+                                                    "room_size": room_size, "door_width": door_width})
+
+
+def stadium(radius=30, aisles=8, gate_width=3, tier_depth=6, pitch_ratio=0.45):
+    # a round bowl: the pitch in the middle is closed off, the stands are split into tiers by walls that
+    # only open onto the radial aisles, and the aisles end in gates through the outer wall
+    size = 2 * radius + 3
+    xs, ys = np.ogrid[:size, :size]
+    dx, dy = xs - size // 2, ys - size // 2
+    distance = np.hypot(dx, dy)
+    angle = np.arctan2(dy, dx)
+
+    # distance to the nearest aisle centre line, in cells
+    aisle_step = 2 * np.pi / aisles
+    offset = np.abs((angle + aisle_step / 2) % aisle_step - aisle_step / 2)
+    in_aisle = distance * np.sin(np.minimum(offset, np.pi / 2)) < gate_width / 2
+
+    pitch = distance < radius * pitch_ratio
+    outside = distance >= radius + 1
+    outer_wall = (distance >= radius) & ~outside
+    tier_walls = ((np.floor(distance) - np.floor(radius * pitch_ratio)) % tier_depth == 0) & ~pitch & ~outer_wall
+    walls = outside | pitch | ((outer_wall | tier_walls) & ~in_aisle)
+
+    gates = outer_wall & in_aisle
+    exits = np.argwhere(gates)
+    stands = ~walls & ~gates & (distance < radius)
+    return Scenario("stadium", walls, exits, stands, {"radius": radius, "aisles": aisles, "gate_width": gate_width,
+                                                     "tier_depth": tier_depth, "pitch_ratio": pitch_ratio})
+
+
+LAYOUTS = {"hourglass": hourglass, "corridor": corridor, "rooms": rooms, "stadium": stadium}
+
+
+def scaled_layout(kind, num_agents, density):
+    # smallest layout of a kind that fits num_agents at the given density, keeping the layout proportions
+    def spawn_cells(scale):
+        return LAYOUTS[kind](**layout_args(kind, scale)).spawn.sum()
+
+    scale = 1
+    while spawn_cells(scale) * density < num_agents:
+        scale *= 2
+    low, high = scale // 2, scale
+    while high - low > 1:
+        middle = (low + high) // 2
+        if spawn_cells(middle) * density < num_agents:
+            low = middle
+        else:
+            high = middle
+    return LAYOUTS[kind](**layout_args(kind, high))
+
+
+def layout_args(kind, scale):
+    if kind == "hourglass":
+        return {"width": 10 * scale, "height": 10 * scale, "neck_width": max(2, scale // 2)}
+    if kind == "corridor":
+        return {"length": 30 * scale, "width": 3 * scale}
+    if kind == "rooms":
+        return {"rooms_x": scale, "rooms_y": scale}
+    return {"radius": 10 * scale, "aisles": max(8, 4 * scale)}
+
+
+def scaling_suite(kind, density=0.3, seed=0, agents=SCALING_AGENTS, folder=SCENARIOS_FOLDER):
+    os.makedirs(folder, exist_ok=True)
+    manifest = []
+    for num_agents in agents:
+        scenario = scaled_layout(kind, num_agents, density).populate(seed, num_agents=num_agents)
+        path = scenario.save(os.path.join(folder, f"{kind}-{num_agents}.npz"))
+        manifest.append({"path": os.path.basename(path), "num_agents": len(scenario.agents),
+                         "grid_width": scenario.width, "grid_height": scenario.height, "seed": seed,
+                         **scenario.layout_args})
+        print(f"{kind}: {len(scenario.agents)} agents on {scenario.width}x{scenario.height} -> {path}")
+
+    with open(os.path.join(folder, f"{kind}-suite.json"), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate procedural scenarios and scaling workloads.")
+    parser.add_argument("kind", choices=sorted(LAYOUTS))
+    parser.add_argument("--size", type=int, nargs="+", default=None,
+                        help="layout arguments in the order of the layout function, e.g. width height neck_width")
+    parser.add_argument("--density", type=float, default=0.3, help="share of the spawn cells taken by agents")
+    parser.add_argument("--agents", type=int, default=None, help="number of agents, overrides --density")
+    parser.add_argument("--obstacles", type=int, default=0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help=".json preset or .npz compiled layout")
+    parser.add_argument("--suite", action="store_true",
+                        help=f"generate the scaling suite of {SCALING_AGENTS[0]} to {SCALING_AGENTS[-1]} agents")
+    args = parser.parse_args()
+
+    if args.suite:
+        scaling_suite(args.kind, args.density, args.seed)
+        return
+
+    scenario = LAYOUTS[args.kind](*(args.size or []))
+    scenario.populate(args.seed, args.density, args.agents, args.obstacles)
+    output = args.output or os.path.join(SCENARIOS_FOLDER, f"{args.kind}-{args.seed}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    print(f"{len(scenario.agents)} agents on {scenario.width}x{scenario.height} -> {scenario.save(output)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import heapq
+
+import mesa
+
+
+class CrowdGrid(mesa.space.SingleGrid):
+    # SingleGrid that reports every cell an agent leaves, either by moving or by being removed
+
+    def __init__(self, width, height, torus, on_vacate=None):
+        super().__init__(width, height, torus)
+        self.on_vacate = on_vacate
+
+    def move_agent(self, agent, pos):
+        # agents that stay put "move" onto their own cell, nothing is vacated then
+        if agent.pos == tuple(pos) and self[pos] is agent:
+            return
+        super().move_agent(agent, pos)
+
+    def remove_agent(self, agent):
+        pos = agent.pos
+        super().remove_agent(agent)
+        if pos is not None and self.on_vacate is not None:
+            self.on_vacate(pos)
+
+
+class ActiveSetActivation(mesa.time.SimultaneousActivation):
+    # Activates agents in the order they were added, like SimultaneousActivation does for CrowdAgent, but
+    # skips agents that sleep. An agent with no free cell around it goes to sleep watching its neighbouring
+    # cells and is woken when one of them is vacated. Woken agents whose turn has not come yet still act in
+    # the current step, so runs match the plain scheduler while the per-step cost follows the agents that
+    # can actually move. A sleeping agent can also ask to be woken at the start of a given step.
+
+    def __init__(self, model):
+        super().__init__(model)
+        self.next_order = 0
+        self.order_of = {}
+        self.agent_at = {}
+        self.awake = set()
+        self.watched = {}
+        self.watchers = {}
+        self.alarms = {}
+        self.queue = []
+        self.current = None
+
+    def add(self, agent):
+        super().add(agent)
+        order = self.next_order
+        self.next_order += 1
+        self.order_of[agent] = order
+        self.agent_at[order] = agent
+        self.awake.add(order)
+
+    def remove(self, agent):
+        super().remove(agent)
+        self.unwatch(agent)
+        order = self.order_of.pop(agent)
+        del self.agent_at[order]
+        self.awake.discard(order)
+
+    def sleep(self, agent, cells, until=None):
+        self.awake.discard(self.order_of[agent])
+        self.watched[agent] = cells
+        for cell in cells:
+            self.watchers.setdefault(cell, set()).add(agent)
+        if until is not None:
+            self.alarms.setdefault(max(until, self.steps + 1), set()).add(agent)
+
+    def unwatch(self, agent):
+        for cell in self.watched.pop(agent, ()):
+            watchers = self.watchers.get(cell)
+            if watchers is not None:
+                watchers.discard(agent)
+                if not watchers:
+                    del self.watchers[cell]
+
+    def wake(self, agent):
+        self.unwatch(agent)
+        order = self.order_of[agent]
+        self.awake.add(order)
+        if self.current is not None and order > self.current:
+            heapq.heappush(self.queue, order)
+
+    def cell_vacated(self, pos):
+        for agent in list(self.watchers.get(pos, ())):
+            self.wake(agent)
+
+    def is_sleeping(self, agent):
+        return agent in self.watched
+
+    def sleeping_agents(self):
+        return list(self.watched)
+
+    def step(self):
+        for agent in self.alarms.pop(self.steps, ()):
+            # the agent may have been woken, or removed, since it set the alarm
+            if agent in self.watched:
+                self.wake(agent)
+
+        # a sorted list is already a valid heap
+        self.queue = sorted(self.awake)
+        while self.queue:
+            self.current = heapq.heappop(self.queue)
+            if self.current in self.awake:
+                self.agent_at[self.current].step()
+        self.current = None
+        self.steps += 1
+        self.time += 1
@@ -1,10 +1,61 @@
+import os
+import pickle
+
 import matplotlib.pyplot as plt
 import numpy as np
 import networkx as nx
-from crowd_model import CrowdAgent
+
+STATS_CACHE_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stats_cache')
+SNAPSHOT_FILE = "snapshot.pkl"
+
+# order in which the figures are shown after a run
+FIGURE_NAMES = [
+    "space_frequency",
+    "collision_history",
+    "collision_heatmap",
+    "intruders_by_zone",
+    "most_used_paths",
+    "wall_clusters",
+    "fundamental_diagram",
+    "time_headways",
+]
+
 
 class Statistics:
 
+    @staticmethod
+    def snapshot(model):
+        # plain, picklable copy of everything the figures need, so they can be built in other processes
+        model.catch_up_sleeping_agents()
+        model.measurements.finish()
+        return {
+            "grid_width": model.grid.width,
+            "grid_height": model.grid.height,
+            "visited_counts": dict(model.visited_counts),
+            "path_counts": dict(model.path_counts),
+            "collision_history": list(model.collision_history),
+            "collision_count": model.collision_count.copy(),
+            "intruders_history": {zone: list(history) for zone, history in model.intruders_history.items()},
+            "agent_paths": [list(agent.visited_positions) for agent in model.agents],
+            "measurement_windows": list(model.measurements.windows),
+            "headways": model.measurements.headways_by_line(),
+        }
+
+    @staticmethod
+    def figure_from_snapshot(name, snapshot):
+        width, height = snapshot["grid_width"], snapshot["grid_height"]
+        builders = {
+            "space_frequency": lambda: Statistics.plot_space_frequency(snapshot["visited_counts"], width, height),
+            "collision_history": lambda: Statistics.plot_collision_history(snapshot["collision_history"]),
+            "collision_heatmap": lambda: Statistics.plot_collision_heatmap(snapshot["collision_count"]),
+            "intruders_by_zone": lambda: Statistics.plot_intruders_by_zone(snapshot["intruders_history"]),
+            "most_used_paths": lambda: Statistics.plot_most_used_paths(snapshot["path_counts"], width, height),
+            "wall_clusters": lambda: Statistics.plot_wall_clusters(snapshot["agent_paths"], width, height),
+            "fundamental_diagram": lambda: Statistics.plot_fundamental_diagram(snapshot["measurement_windows"]),
+            "time_headways": lambda: Statistics.plot_time_headways(snapshot["headways"]),
+        }
+        return builders[name]()
+
     @staticmethod
     def plot_space_frequency(visited_counts, grid_width, grid_height):
         visit_density = np.zeros((grid_width, grid_height))
@@ -33,6 +84,17 @@ class Statistics:
 
         return fig
 
+    @staticmethod
+    def plot_collision_heatmap(collision_count):
+        fig, ax = plt.subplots(figsize=(6, 4))
+        cax = ax.imshow(np.asarray(collision_count).T, interpolation='nearest', cmap='Reds')
+        fig.colorbar(cax, label='Liczba prób kolizji')
+        ax.set_title('Mapa kolizji (nieudane rezerwacje pól)')
+        ax.set_xlabel('Oś X siatki')
+        ax.set_ylabel('Oś Y siatki')
+
+        return fig
+
     @staticmethod
     def plot_intruders_by_zone(intruders_history):
         fig, ax = plt.subplots(figsize=(6, 4))
@@ -100,9 +162,9 @@ class Statistics:
         return fig
 
     @staticmethod
-    def plot_wall_clusters(agents, grid_width, grid_height):
-        agent_positions = [agent.visited_positions for agent in agents]
-        n_agents = len(agents)
+    def plot_wall_clusters(agent_paths, grid_width, grid_height):
+        agent_positions = list(agent_paths)
+        n_agents = len(agent_positions)
         avg_distances = []
 
         def x_bounds(y):
@@ -134,3 +196,89 @@ class Statistics:
 
         return fig
 
+    @staticmethod
+    def plot_fundamental_diagram(measurement_windows):
+        fig, ax = plt.subplots(figsize=(6, 4))
+
+        areas = {}
+        for window in measurement_windows:
+            if window["kind"] == "area":
+                areas.setdefault(window["name"], []).append((window["density"], window["specific_flow"]))
+
+        for name, points in areas.items():
+            density, flow = zip(*points)
+            ax.scatter(density, flow, label=f"Obszar {name}", alpha=0.7)
+
+        ax.set_title("Diagram fundamentalny (gęstość - przepływ)")
+        ax.set_xlabel("Gęstość [agenci / pole]")
+        ax.set_ylabel("Przepływ właściwy [agenci / krok / pole]")
+        if areas:
+            ax.legend()
+        ax.grid(True)
+
+        return fig
+
+    @staticmethod
+    def plot_time_headways(headways):
+        fig, ax = plt.subplots(figsize=(6, 4))
+
+        for name, counts in headways.items():
+            if counts:
+                steps = sorted(counts)
+                ax.bar(steps, [counts[step] for step in steps], alpha=0.6, label=f"Linia {name}")
+
+        ax.set_title("Rozkład odstępów czasowych między przejściami")
+        ax.set_xlabel("Odstęp czasowy [kroki]")
+        ax.set_ylabel("Liczba przejść")
+        if any(headways.values()):
+            ax.legend()
+        ax.grid(True)
+
+        return fig
+
+
+def render_figure(name, snapshot, path):
+    # runs in a worker process, writes through a temporary file so the cache never holds half a png
+    plt.switch_backend('Agg')
+    fig = Statistics.figure_from_snapshot(name, snapshot)
+    temp_path = f"{path}.tmp.png"
+    fig.savefig(temp_path)
+    plt.close(fig)
+    os.replace(temp_path, path)
+    return path
+
+
+# snapshot a figure worker renders from, set once by init_figure_worker instead of being pickled with every figure
+worker_snapshot = None
+
+
+def init_figure_worker(snapshot):
+    global worker_snapshot
+    worker_snapshot = snapshot
+
+
+def render_worker_figure(name, path):
+    return render_figure(name, worker_snapshot, path)
+
+
+def save_snapshot(snapshot, folder):
+    # kept next to the cached figures, so a finished run can be reopened and its missing figures rebuilt
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, SNAPSHOT_FILE)
+    with open(f"{path}.tmp", 'wb') as f:
+        pickle.dump(snapshot, f)
+    os.replace(f"{path}.tmp", path)
+
+
+def load_snapshot(folder):
+    with open(os.path.join(folder, SNAPSHOT_FILE), 'rb') as f:
+        return pickle.load(f)
+
+
+def cached_runs():
+    # run ids with a saved snapshot, newest first
+    if not os.path.isdir(STATS_CACHE_FOLDER):
+        return []
+    paths = [os.path.join(STATS_CACHE_FOLDER, run_id, SNAPSHOT_FILE) for run_id in os.listdir(STATS_CACHE_FOLDER)]
+    paths = sorted((path for path in paths if os.path.exists(path)), key=os.path.getmtime, reverse=True)
+    return [os.path.basename(os.path.dirname(path)) for path in paths]
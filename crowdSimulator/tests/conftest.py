@@ -0,0 +1,48 @@
+import os
+import sys
+
+import pytest
+
+# the simulator modules are imported by bare name, like in crowdSimulator itself
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent import CrowdAgent
+from crowd_model import CrowdModel
+
+PRESETS_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "presets")
+
+
+def load_model(preset, seed):
+    # a bundled preset by name or a preset path
+    path = preset if os.path.isabs(preset) else os.path.join(PRESETS_FOLDER, preset)
+    return CrowdModel(path, "Headless", overrides={"export": False}, seed=seed)
+
+
+def run_model(preset, seed=None, max_steps=300, until_done=True, on_step=None):
+    # a preset or an already built model; with until_done=False a fixed number of steps is run,
+    # so runs can end with agents still asleep or just woken
+    model = preset if isinstance(preset, CrowdModel) else load_model(preset, seed)
+    for _ in range(max_steps):
+        model.step()
+        if on_step is not None:
+            on_step(model)
+        if until_done and all(not agent.has_moved for agent in model.schedule.agents):
+            break
+    model.catch_up_sleeping_agents()
+    return model
+
+
+@pytest.fixture
+def load():
+    return load_model
+
+
+@pytest.fixture
+def run():
+    return run_model
+
+
+@pytest.fixture
+def sleep_disabled(monkeypatch):
+    # the reference path: agents never fall asleep and take every turn themselves
+    monkeypatch.setattr(CrowdAgent, "fall_asleep", lambda self, *args, **kwargs: None)
@@ -0,0 +1,24 @@
+import os
+
+from calibration import BASE_FOLDER, simulate
+
+PRESET = os.path.join(BASE_FOLDER, "presets", "social_distances.json")
+TARGETS = {"evacuation_time": 150, "neck_flow": 0.25}
+
+
+def test_run_is_not_stopped_before_the_target_time():
+    full = simulate(PRESET, {}, 0, TARGETS, 600)
+    # a cutoff above the full-run loss must not change the result
+    cut = simulate(PRESET, {}, 0, TARGETS, 600, cutoff=full["loss"] + 0.5)
+    assert not cut["stopped_early"]
+    assert cut == full
+
+
+def test_early_stop_only_past_the_target_time():
+    targets = {"evacuation_time": 10, "neck_flow": 0.25}
+    result = simulate(PRESET, {}, 0, targets, 600, cutoff=0.1)
+    assert result["stopped_early"]
+    steps = result["metrics"]["evacuation_time"]
+    assert steps > targets["evacuation_time"]
+    assert ((steps - 10) / 10) ** 2 > 0.1
+    assert result["loss"] > 0.1
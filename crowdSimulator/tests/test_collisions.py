@@ -0,0 +1,17 @@
+import pytest
+
+
+@pytest.mark.parametrize("preset", ["params3.json", "social_distances.json"])
+def test_blocked_agents_are_counted(run, preset):
+    model = run(preset, 0)
+    assert sum(model.collision_history) > 0
+    assert model.collision_count.sum() == sum(model.collision_history)
+
+
+@pytest.mark.parametrize("preset", ["params2.json", "params3.json", "social_distances.json"])
+def test_sleeping_agents_keep_counting(run, request, preset):
+    asleep = run(preset, 1)
+    request.getfixturevalue("sleep_disabled")
+    awake = run(preset, 1)
+    assert asleep.collision_history == awake.collision_history
+    assert (asleep.collision_count == awake.collision_count).all()
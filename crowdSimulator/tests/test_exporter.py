@@ -0,0 +1,57 @@
+import importlib.util
+
+import pandas as pd
+import pytest
+
+from exporter import EXPORT_FORMATS, RunExporter, iter_run_table, load_run_table
+
+
+@pytest.mark.parametrize("file_format", EXPORT_FORMATS)
+def test_run_table_round_trip(load, run, tmp_path, file_format):
+    model = load("params3.json", 0)
+    # small batches, so every table is written in several parts
+    exporter = RunExporter(model, str(tmp_path), file_format, positions=True, batch_size=7, positions_batch_size=500)
+    metrics = []
+    positions = []
+
+    def record_positions(model):
+        positions.extend((model.schedule.steps, agent.unique_id, agent.pos[0], agent.pos[1])
+                         for agent in model.schedule.agents if agent.pos is not None)
+
+    def record(model):
+        exporter.record(model)
+        metrics.append(model.step_metrics())
+        record_positions(model)
+
+    record_positions(model)
+    run(model, on_step=record)
+    exporter.close()
+    run_folder = exporter.folder
+    assert model.run_id in run_folder
+
+    expected_metrics = pd.DataFrame(metrics)
+    pd.testing.assert_frame_equal(load_run_table(run_folder, "metrics"), expected_metrics, check_dtype=False)
+
+    expected_positions = pd.DataFrame(positions, columns=["step", "agent_id", "x", "y"])
+    loaded = load_run_table(run_folder, "positions")
+    pd.testing.assert_frame_equal(loaded, expected_positions, check_dtype=False)
+
+    chunks = list(iter_run_table(run_folder, "positions", chunksize=300))
+    assert len(chunks) > 1
+    pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True), loaded)
+
+
+def test_unknown_format_is_rejected(run, tmp_path):
+    model = run("params3.json", 0, max_steps=1)
+    with pytest.raises(ValueError):
+        RunExporter(model, str(tmp_path), "xlsx")
+
+
+@pytest.mark.parametrize("file_format", ["parquet", "feather"])
+def test_missing_pyarrow_fails_up_front(run, tmp_path, monkeypatch, file_format):
+    find_spec = importlib.util.find_spec
+    monkeypatch.setattr(importlib.util, "find_spec", lambda name, *args: None if name == "pyarrow"
+                        else find_spec(name, *args))
+    model = run("params3.json", 0, max_steps=1)
+    with pytest.raises(ImportError, match="pyarrow"):
+        RunExporter(model, str(tmp_path), file_format)
@@ -0,0 +1,39 @@
+import json
+import os
+
+import pytest
+
+from statistics import Statistics
+
+PRESETS_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "presets")
+
+
+def params3_with_window(tmp_path, window):
+    with open(os.path.join(PRESETS_FOLDER, "params3.json")) as f:
+        preset = json.load(f)
+    preset["measurement_window"] = window
+    path = tmp_path / "params3.json"
+    path.write_text(json.dumps(preset))
+    return str(path)
+
+
+@pytest.mark.parametrize("window", [10, 300])
+def test_last_partial_window_is_closed(run, tmp_path, window):
+    # params3 evacuates in 64 steps, so with either window the run ends inside one
+    model = run(params3_with_window(tmp_path, window), 0)
+    windows = Statistics.snapshot(model)["measurement_windows"]
+    lines = [window for window in windows if window["kind"] == "line"]
+    assert lines and lines[-1]["step"] == model.measurements.step
+
+    # every crossing of the run is in some window
+    starts = [0] + [window["step"] for window in lines[:-1]]
+    crossings = sum(window["flow"] * (window["step"] - start) for window, start in zip(lines, starts))
+    assert crossings == pytest.approx(model.measurements.line_totals[0])
+
+
+def test_finish_closes_a_window_once(run):
+    model = run("params3.json", 0)
+    model.measurements.finish()
+    closed = len(model.measurements.windows)
+    model.measurements.finish()
+    assert len(model.measurements.windows) == closed
@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+
+from parallel_engine import ParallelCrowdEngine, benchmark_params
+
+
+def test_workers_match_the_reference_path():
+    params = benchmark_params(40, 0.3)
+    results = []
+    for workers in (1, 2):
+        with ParallelCrowdEngine.from_params(params, seed=0, workers=workers) as engine:
+            engine.run(10)
+            results.append((engine.visited_counts(), engine.collision_count(), engine.exits))
+    assert np.array_equal(results[0][0], results[1][0])
+    assert np.array_equal(results[0][1], results[1][1])
+    assert results[0][2] == results[1][2]
+
+
+def test_worker_error_is_raised_instead_of_hanging():
+    params = benchmark_params(40, 0.3)
+    with ParallelCrowdEngine.from_params(params, seed=0, workers=2) as engine:
+        # an agent id past the agent arrays makes the worker owning the last row fail
+        engine.state.occupancy[-1, 0] = engine.num_agents + 5
+        with pytest.raises(RuntimeError, match="worker 1 failed"):
+            engine.run(5)
+        with pytest.raises(RuntimeError):
+            engine.run(1)
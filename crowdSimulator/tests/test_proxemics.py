@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from proxemics import NEIGHBOUR_CELLS, ZONE_WEIGHTS, ZONES, ProxemicIndex
+
+
+def border_positions(seed, count=120, size=40):
+    # half of the agents on the first or last cell of a bin, where the 3x3 bin lookup is easiest to get wrong
+    rng = np.random.default_rng(seed)
+    bin_size = ProxemicIndex().bin_size
+    borders = np.array([c for c in range(size) if c % bin_size in (0, bin_size - 1)])
+    cells = {tuple(cell) for cell in rng.choice(borders, size=(count // 2, 2))}
+    cells |= {tuple(cell) for cell in rng.integers(0, size, size=(count // 2, 2))}
+    return np.array(sorted(cells), dtype=np.int64)
+
+
+def zone_of(distance):
+    for zone in sorted(ZONES, key=ZONES.get):
+        if distance <= ZONES[zone]:
+            return zone
+    return None
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_zone_totals_match_all_pairs(seed):
+    positions = border_positions(seed)
+    index = ProxemicIndex()
+    index.build(positions)
+
+    expected = dict.fromkeys(ZONES, 0)
+    for i, a in enumerate(positions):
+        for j, b in enumerate(positions):
+            zone = zone_of(np.hypot(*(a - b))) if i != j else None
+            if zone is not None:
+                expected[zone] += 1
+    assert index.zone_totals() == expected
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_intrusion_cost_matches_all_agents(seed):
+    positions = border_positions(seed)
+    index = ProxemicIndex()
+    index.build(positions)
+
+    for pos in positions:
+        candidates = pos + np.array(NEIGHBOUR_CELLS)
+        expected = []
+        for candidate in candidates:
+            zones = [zone_of(np.hypot(*(candidate - other))) for other in positions if tuple(other) != tuple(pos)]
+            expected.append(sum(ZONE_WEIGHTS[zone] for zone in zones if zone is not None))
+        assert index.intrusion_cost(candidates, index.neighbours(pos)) == pytest.approx(expected)
+
+
+def test_empty_index():
+    index = ProxemicIndex()
+    index.build([])
+    assert index.zone_totals() == dict.fromkeys(ZONES, 0)
+    assert list(index.intrusion_cost([(3, 3)], index.neighbours((3, 3)))) == [0.0]
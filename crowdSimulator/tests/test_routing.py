@@ -0,0 +1,90 @@
+import json
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from routing import NEAREST_GROUPS, UNREACHABLE, ExitRouter
+
+
+def routing_preset(tmp_path, **params):
+    # the layout of ParamsChoice.create_random_params
+    preset = {
+        "num_agents": 15,
+        "num_objectives": 30,
+        "num_obstacles": 40,
+        "randomize_objectives": False,
+        "objectives": [{"position": [i, 29], "preset": "exit", "color": [0, 0, 128]} for i in range(30)],
+        "randomize_obstacles": True,
+        "movement_mode": "routing",
+        "grid_width": 30,
+        "grid_height": 30,
+        "export": False,
+    }
+    preset.update(params)
+    path = tmp_path / "routing.json"
+    path.write_text(json.dumps(preset))
+    return str(path)
+
+
+def congested_preset(tmp_path):
+    # few exits and many agents, so queues form and boxed-in agents sleep
+    objectives = [{"position": [x, 29], "preset": "exit", "color": [0, 0, 128]} for x in (4, 5, 24, 25)]
+    return routing_preset(tmp_path, num_agents=200, num_objectives=4, objectives=objectives, route_interval=3)
+
+
+def run_recorded(run, path, seed, max_steps=600):
+    positions = []
+    model = run(path, seed, max_steps,
+                on_step=lambda model: positions.append(sorted((agent.unique_id, agent.pos)
+                                                              for agent in model.schedule.agents)))
+    return model, positions
+
+
+def test_agent_starting_on_an_exit_leaves(run, tmp_path):
+    path = routing_preset(tmp_path, num_agents=1, num_obstacles=0, randomize_obstacles=False,
+                          agent_positions=[[5, 29]])
+    model, positions = run_recorded(run, path, 0, max_steps=10)
+    assert positions[0] == []
+    assert len(positions) == 1
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_sleeping_matches_awake_agents(run, request, tmp_path, seed):
+    path = congested_preset(tmp_path)
+    asleep, asleep_positions = run_recorded(run, path, seed)
+
+    request.getfixturevalue("sleep_disabled")
+    awake, awake_positions = run_recorded(run, path, seed)
+
+    assert asleep_positions == awake_positions
+    assert asleep.visited_counts == awake.visited_counts
+    assert asleep.path_counts == awake.path_counts
+    assert list(asleep.router.queue_lengths) == list(awake.router.queue_lengths)
+    assert asleep.collision_history == awake.collision_history
+    assert (asleep.collision_count == awake.collision_count).all()
+
+
+def full_scan_exit(router, pos):
+    costs = [(field[pos] + router.congestion_weight * router.queue_lengths[group], group)
+             for group, field in enumerate(router.fields) if field[pos] != UNREACHABLE]
+    return min(costs)[1] if costs else None
+
+
+@pytest.mark.parametrize("congestion_weight", [0.0, 1.0, 5.0])
+def test_nearest_groups_choose_like_a_full_scan(congestion_weight):
+    # separate gates on every side of a walled yard, with long queues at some of them
+    rng = np.random.default_rng(0)
+    size = 40
+    gates = [(x, 0) for x in range(2, size, 5)] + [(x, size - 1) for x in range(4, size, 6)] + \
+            [(0, y) for y in range(3, size, 7)]
+    walls = [tuple(cell) for cell in rng.integers(1, size - 1, size=(150, 2))]
+    router = ExitRouter(size, size, [SimpleNamespace(pos=gate) for gate in gates], walls,
+                        congestion_weight=congestion_weight)
+    assert len(router.groups) > NEAREST_GROUPS
+
+    for _ in range(5):
+        router.queue_lengths = rng.integers(0, 30, size=len(router.groups))
+        for x in range(size):
+            for y in range(size):
+                assert router.choose_exit((x, y)) == full_scan_exit(router, (x, y))
@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+from routing import UNREACHABLE, distance_field
+from scenario_generator import LAYOUTS, hourglass, reachable, rooms
+
+
+def reaches_an_exit(scenario):
+    blocked = scenario.walls.copy()
+    blocked[scenario.obstacles[:, 0], scenario.obstacles[:, 1]] = True
+    field = distance_field(scenario.width, scenario.height, [tuple(exit) for exit in scenario.exits], blocked)
+    return field[scenario.agents[:, 0], scenario.agents[:, 1]] != UNREACHABLE
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_obstacles_never_cut_agents_off(seed):
+    scenario = hourglass(30, 30, 2).populate(seed, density=0.3, num_obstacles=40)
+    assert len(scenario.obstacles) == 40
+    assert reaches_an_exit(scenario).all()
+
+
+@pytest.mark.parametrize("kind", sorted(LAYOUTS))
+def test_agents_do_not_start_on_exits(kind):
+    scenario = LAYOUTS[kind]().populate(0, density=1.0, num_obstacles=10)
+    assert not scenario.exit_mask()[scenario.agents[:, 0], scenario.agents[:, 1]].any()
+    assert reaches_an_exit(scenario).all()
+
+
+def test_reachable_matches_distance_field():
+    scenario = rooms()
+    expected = distance_field(scenario.width, scenario.height, [tuple(exit) for exit in scenario.exits],
+                              scenario.walls) != UNREACHABLE
+    assert np.array_equal(reachable(scenario.walls, scenario.exits), expected)
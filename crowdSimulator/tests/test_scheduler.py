@@ -0,0 +1,17 @@
+import pytest
+
+
+@pytest.mark.parametrize("preset, seed, steps", [
+    ("params2.json", 1, 300),
+    ("params3.json", 0, 30),
+    ("params1.json", 2, 150),
+])
+def test_sleeping_matches_awake_agents(run, request, preset, seed, steps):
+    asleep = run(preset, seed, steps, until_done=False)
+    request.getfixturevalue("sleep_disabled")
+    awake = run(preset, seed, steps, until_done=False)
+
+    assert asleep.visited_counts == awake.visited_counts
+    assert asleep.path_counts == awake.path_counts
+    assert ({agent.unique_id: (agent.pos, agent.steps) for agent in asleep.schedule.agents}
+            == {agent.unique_id: (agent.pos, agent.steps) for agent in awake.schedule.agents})
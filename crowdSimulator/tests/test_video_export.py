@@ -0,0 +1,59 @@
+import cv2
+import numpy as np
+import pytest
+from PIL import Image
+
+from exporter import RunExporter
+from video_export import (AGENT_COLOR, BACKGROUND_COLOR, OBSTACLE_COLOR, FrameRaster, export_video,
+                          model_frames, recorded_frames)
+
+
+def test_recording_has_the_frames_of_the_run(load, run, tmp_path):
+    # params3 evacuates in 64 steps, the last ones without any agent left
+    expected = list(model_frames(load("params3.json", 0)))
+
+    model = load("params3.json", 0)
+    exporter = RunExporter(model, str(tmp_path), positions=True)
+    run(model, on_step=exporter.record)
+    exporter.close()
+    frames = list(recorded_frames(exporter.folder, chunksize=200))
+
+    assert len(frames) == len(expected)
+    for frame, positions in zip(frames, expected):
+        assert sorted(map(tuple, frame)) == sorted(map(tuple, positions))
+
+
+def test_raster_draws_agents_and_obstacles():
+    raster = FrameRaster(4, 3, obstacles=[(3, 2)], objectives=[((0, 2), (0, 0, 128))], cell_size=9)
+    frame = raster.render(np.array([[1, 0]]), np.zeros((0, 2), dtype=np.int64))
+    assert frame.shape == (27, 36, 3)
+    center = 4
+    assert tuple(frame[center, 9 + center]) == AGENT_COLOR
+    assert tuple(frame[center, center]) == BACKGROUND_COLOR
+    assert tuple(frame[18 + center, 27 + center]) == OBSTACLE_COLOR
+    assert tuple(frame[18 + center, center]) == (0, 0, 128)
+
+
+def count_frames(path):
+    if path.endswith(".gif"):
+        with Image.open(path) as image:
+            return image.n_frames
+    capture = cv2.VideoCapture(path)
+    frames = 0
+    while capture.read()[0]:
+        frames += 1
+    capture.release()
+    return frames
+
+
+@pytest.mark.parametrize("extension", [".gif", ".mp4"])
+def test_export_matches_across_workers(load, tmp_path, extension):
+    outputs = []
+    for workers in (1, 2):
+        model = load("params3.json", 0)
+        path = str(tmp_path / f"run-{workers}{extension}")
+        written = export_video(model_frames(model), FrameRaster.from_model(model), path, workers=workers)
+        assert count_frames(path) == written
+        with open(path, "rb") as f:
+            outputs.append(f.read())
+    assert outputs[0] == outputs[1]
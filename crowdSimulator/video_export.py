@@ -0,0 +1,298 @@
+import argparse
+import json
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import count
+
+import cv2
+import numpy as np
+from PIL import GifImagePlugin, Image
+
+from crowd_model import CrowdModel
+from exporter import EXPORTS_FOLDER, iter_run_table
+
+# colors of SimulationVisualization
+BACKGROUND_COLOR = (255, 255, 255)
+GRID_COLOR = (200, 200, 200)
+OBSTACLE_COLOR = (128, 128, 128)
+AGENT_COLOR = (208, 168, 52)
+TRAIL_ALPHA = 30 / 255
+
+
+class FrameRaster:
+    # Draws what SimulationVisualization.draw_* put on the screen straight into an RGB array: grid lines,
+    # objectives, agents as discs, the fading trail of their last positions and the obstacles on top.
+    # Everything that does not change between frames is drawn once here, a frame only scatters the agents.
+
+    def __init__(self, width, height, obstacles, objectives, cell_size=None, funnel=False):
+        self.width = width
+        self.height = height
+        self.cell_size = cell_size or max(2, 600 // max(width, height))
+        s = self.cell_size
+
+        # pixel -> cell lookups and the position inside the cell, rows are y like on screen
+        self.cell_y = np.arange(height * s) // s
+        self.cell_x = np.arange(width * s) // s
+        inner_y = np.arange(height * s) % s
+        inner_x = np.arange(width * s) % s
+
+        offset = np.arange(s) - s // 2
+        disc = offset[:, None] ** 2 + offset[None, :] ** 2 <= (s // 3) ** 2
+        self.disc = np.tile(disc, (height, width))
+
+        background = np.empty((height * s, width * s, 3), dtype=np.uint8)
+        background[:] = BACKGROUND_COLOR
+        grid_lines = ((inner_y == 0) | (inner_y == s - 1))[:, None] | ((inner_x == 0) | (inner_x == s - 1))[None, :]
+        background[grid_lines] = GRID_COLOR
+        for position, color in objectives:
+            x, y = position
+            background[y * s:(y + 1) * s, x * s:(x + 1) * s] = color
+        self.background = background
+
+        blocked = np.zeros((height, width), dtype=bool)
+        obstacles = np.asarray(obstacles, dtype=np.int64).reshape(-1, 2)
+        blocked[obstacles[:, 1], obstacles[:, 0]] = True
+        if funnel:
+            # the hourglass of draw_obstacles, only painted over the grid
+            n = width
+            ys, xs = np.ogrid[:height, :width]
+            blocked |= ((xs < ys) & (xs < n - ys - 1)) | ((xs > ys) & (xs > n - ys - 1))
+        self.obstacles = self.expand(blocked)
+
+        self.objective_colors = [tuple(color) for _, color in objectives]
+
+    @classmethod
+    def from_model(cls, model, cell_size=None):
+        return cls(model.grid.width, model.grid.height,
+                   [obstacle.pos for obstacle in model.obstacles],
+                   [(destination.pos, destination.color) for destination in model.destinations],
+                   cell_size, funnel=model.params.get("scenario") is None)
+
+    @classmethod
+    def from_run(cls, run, cell_size=None):
+        # run.json written by RunExporter
+        return cls(run["grid_width"], run["grid_height"], run.get("obstacles", []),
+                   [(objective["position"], objective["color"]) for objective in run.get("objectives", [])],
+                   cell_size, funnel=run["params"].get("scenario") is None)
+
+    @property
+    def size(self):
+        return self.width * self.cell_size, self.height * self.cell_size
+
+    def expand(self, cells):
+        # per-cell [y, x] array -> per-pixel array
+        return cells[np.ix_(self.cell_y, self.cell_x)]
+
+    def render(self, positions, trail):
+        frame = self.background.copy()
+
+        occupied = np.zeros((self.height, self.width), dtype=bool)
+        occupied[positions[:, 1], positions[:, 0]] = True
+        frame[self.expand(occupied) & self.disc] = AGENT_COLOR
+
+        # every remembered position adds one translucent disc, like the trail surfaces blitted by draw_agents
+        visits = np.bincount(trail[:, 1] * self.width + trail[:, 0], minlength=self.width * self.height)
+        visits = self.expand(visits.reshape(self.height, self.width))
+        touched = (visits > 0) & self.disc
+        alpha = (1 - (1 - TRAIL_ALPHA) ** visits[touched].astype(np.float32))[:, None]
+        frame[touched] = (frame[touched] * (1 - alpha) + np.array(AGENT_COLOR) * alpha + 0.5).astype(np.uint8)
+
+        frame[self.obstacles] = OBSTACLE_COLOR
+        return frame
+
+    def palette(self, size=(1, 1), trail_levels=24):
+        # fixed gif palette: every flat color plus the trail blended over each of them
+        base = [BACKGROUND_COLOR, GRID_COLOR, OBSTACLE_COLOR, AGENT_COLOR, *self.objective_colors]
+        colors = list(dict.fromkeys(base))
+        for visits in range(1, trail_levels + 1):
+            alpha = 1 - (1 - TRAIL_ALPHA) ** visits
+            for color in base:
+                blend = tuple(int(c * (1 - alpha) + a * alpha + 0.5) for c, a in zip(color, AGENT_COLOR))
+                if blend not in colors:
+                    colors.append(blend)
+        colors = colors[:256]
+        colors += [(0, 0, 0)] * (256 - len(colors))
+        image = Image.new("P", size)
+        image.putpalette([channel for color in colors for channel in color])
+        return image
+
+
+# state of a rendering worker, set once by init_worker instead of being pickled with every frame
+worker_raster = None
+worker_format = None
+worker_palette = None
+worker_duration = None
+
+
+def init_worker(raster, video_format, duration):
+    global worker_raster, worker_format, worker_palette, worker_duration
+    worker_raster = raster
+    worker_format = video_format
+    worker_palette = raster.palette() if video_format == "gif" else None
+    worker_duration = duration
+
+
+def render_frame(positions, trail):
+    # frames leave the worker ready to be written: BGR for cv2, or an lzw-compressed gif image block
+    frame = worker_raster.render(positions, trail)
+    if worker_format == "mp4":
+        return cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
+    image = Image.fromarray(frame).quantize(palette=worker_palette, dither=Image.Dither.NONE)
+    return b"".join(GifImagePlugin.getdata(image, duration=worker_duration))
+
+
+class VideoWriter:
+    # MP4 through cv2, GIF written block by block with one global palette, so neither keeps past frames
+
+    def __init__(self, path, raster, fps):
+        self.path = path
+        self.format = video_format(path)
+        if self.format == "mp4":
+            self.writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, raster.size)
+            if not self.writer.isOpened():
+                raise RuntimeError(f"Cannot open video writer for {path}")
+        else:
+            self.file = open(path, "wb")
+            header, _ = GifImagePlugin.getheader(raster.palette(raster.size), info={"loop": 0, "optimize": False})
+            self.file.write(b"".join(header))
+
+    def write(self, frame):
+        if self.format == "mp4":
+            self.writer.write(frame)
+        else:
+            self.file.write(frame)
+
+    def close(self):
+        if self.format == "mp4":
+            self.writer.release()
+        else:
+            self.file.write(b";")
+            self.file.close()
+
+
+def video_format(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in (".mp4", ".gif"):
+        raise ValueError(f"Unknown video format {extension!r}, expected .mp4 or .gif")
+    return extension[1:]
+
+
+def agent_positions(model):
+    return np.array([agent.pos for agent in model.schedule.agents if agent.pos is not None],
+                    dtype=np.int64).reshape(-1, 2)
+
+
+def model_frames(model, max_steps=None):
+    # steps a headless model like run_scenario does, one frame per state
+    yield agent_positions(model)
+    for _ in range(max_steps) if max_steps is not None else count():
+        model.step()
+        yield agent_positions(model)
+        if all(not agent.has_moved for agent in model.schedule.agents):
+            return
+
+
+def empty_frames(last_step, step):
+    # the steps between two recorded ones had no agent left
+    for _ in range(step - last_step - 1 if last_step is not None else 0):
+        yield np.zeros((0, 2), dtype=np.int64)
+
+
+def recorded_frames(run_folder, chunksize=100000):
+    # positions exported by RunExporter, read chunk by chunk; rows come step by step, so only the last step
+    # of a chunk can continue in the next one. Steps without any agent left give empty frames, up to the
+    # last step of the metrics, so a replay has as many frames as model_frames gave for the run.
+    last_step = None
+    carry = np.zeros((0, 3), dtype=np.int64)
+    for chunk in iter_run_table(run_folder, "positions", chunksize):
+        rows = np.concatenate([carry, chunk[["step", "x", "y"]].to_numpy(dtype=np.int64)])
+        steps = np.split(rows, np.flatnonzero(np.diff(rows[:, 0])) + 1)
+        carry = steps.pop()
+        for step_rows in steps:
+            yield from empty_frames(last_step, step_rows[0, 0])
+            last_step = step_rows[0, 0]
+            yield step_rows[:, 1:]
+    if len(carry):
+        yield from empty_frames(last_step, carry[0, 0])
+        last_step = carry[0, 0]
+        yield carry[:, 1:]
+
+    final_step = max((chunk["step"].max() for chunk in iter_run_table(run_folder, "metrics", chunksize)
+                      if len(chunk)), default=None)
+    if final_step is not None:
+        yield from empty_frames(last_step, final_step + 1)
+
+
+def export_video(frames, raster, path, fps=30, workers=None, trail_length=4, max_in_flight=None):
+    # Frames are rasterized in a process pool while the next positions are produced here. Only
+    # max_in_flight frames exist at a time and they are written in order as soon as they are done.
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or 2 * workers
+    video = video_format(path)
+    duration = 1000 / fps
+    writer = VideoWriter(path, raster, fps)
+    trail = deque(maxlen=trail_length)
+    written = 0
+
+    try:
+        if workers == 1:
+            init_worker(raster, video, duration)
+            for positions in frames:
+                trail.append(positions)
+                writer.write(render_frame(positions, np.concatenate(trail)))
+                written += 1
+            return written
+
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=init_worker,
+                                 initargs=(raster, video, duration)) as pool:
+            pending = deque()
+            for positions in frames:
+                trail.append(positions)
+                pending.append(pool.submit(render_frame, positions, np.concatenate(trail)))
+                if len(pending) >= max_in_flight:
+                    writer.write(pending.popleft().result())
+                    written += 1
+            while pending:
+                writer.write(pending.popleft().result())
+                written += 1
+        return written
+    finally:
+        writer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render a run to MP4 or GIF without a display.")
+    parser.add_argument("source", help="preset json to simulate headless, or an exported run folder")
+    parser.add_argument("--output", help="video path, .mp4 or .gif")
+    parser.add_argument("--steps", type=int, default=10000,
+                        help="stop a simulated run after this many steps if agents are still moving")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--cell-size", type=int, default=None, help="pixels per cell")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    if os.path.isdir(args.source):
+        with open(os.path.join(args.source, "run.json"), "r") as f:
+            run = json.load(f)
+        raster = FrameRaster.from_run(run, args.cell_size)
+        frames = recorded_frames(args.source)
+        trail_length = run["params"].get("memory_limit", 4)
+        output = args.output or os.path.join(args.source, "simulation.mp4")
+    else:
+        model = CrowdModel(args.source, "Headless", seed=args.seed)
+        raster = FrameRaster.from_model(model, args.cell_size)
+        frames = model_frames(model, args.steps)
+        trail_length = model.params.get("memory_limit", 4)
+        output = args.output or os.path.join(EXPORTS_FOLDER, model.run_id, "simulation.mp4")
+
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    written = export_video(frames, raster, output, args.fps, args.workers, trail_length)
+    print(f"{written} frames -> {output}")
+
+
+if __name__ == "__main__":
+    main()